@@ -0,0 +1,252 @@
+"""Benchmarks of the converter hot paths on synthetic datasets.
+
+Run from the root of the repository, e.g.:
+
+    python -m benchmarks.run_benchmarks --num_boxes 1000000 --output_json benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --num_boxes 1000000 --baseline benchmarks/baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import traceback
+import contextlib
+import multiprocessing
+from queue import Empty
+
+import helpers.helpers as helpers
+import helpers.metrics as metrics
+import benchmarks.synthetic as synthetic
+from helpers.converter import AnnotationConverter
+
+INPUT_FORMATS = ('coco_json', 'oidv6_csv', 'yolo_textfiles')
+
+
+@contextlib.contextmanager
+def timed_stage(results, stage, quiet=True):
+    """Times the code of a with block and records it in results[stage]. The block sets the number of bboxes and files it
+    processed in the yielded dict, to compute throughputs. Peak memory is that of the main process during the block, measured
+    like the stages of --metrics_report (see helpers/metrics.py). With quiet, prints and progress bars of the block are hidden."""
+    counts = {'boxes': 0, 'files': 0}
+    output = contextlib.ExitStack()
+    if quiet:
+        output.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        output.enter_context(contextlib.redirect_stderr(io.StringIO()))
+    with output, metrics.MetricsRecorder().stage(stage) as stage_metrics:
+        yield counts
+    seconds = stage_metrics.wall_seconds
+    results[stage] = {'seconds': round(seconds, 4), 'cpu_seconds': round(stage_metrics.cpu_seconds, 4),
+                        'boxes': counts['boxes'], 'boxes_per_s': round(counts['boxes'] / seconds, 1) if seconds else None,
+                        'files': counts['files'], 'files_per_s': round(counts['files'] / seconds, 1) if seconds else None,
+                        'peak_rss_mb': round(stage_metrics.peak_rss_bytes / 2**20, 1)}
+
+
+def make_converter(input_annotation_format, input_annotations, categories, num_workers, **options):
+    config = {'categories': categories, 'input_annotation_format': input_annotation_format, 'input_annotations': input_annotations,
+                'output_annotation_format': 'yolo_textfiles', 'output_annotations': None, 'test_split_percentage': 0,
+                'num_workers': num_workers}
+    config.update(options)
+    return AnnotationConverter(config)
+
+
+def generate_dataset(input_annotation_format, data_dir, args):
+    """Writes the synthetic input of a format (unless it is already in data_dir) and returns its path."""
+    name = f'{input_annotation_format}_{args.num_boxes}_{args.boxes_per_image}_{args.num_categories}_{args.seed}'
+    input_path = os.path.join(data_dir, name + {'coco_json': '.json', 'oidv6_csv': '.csv', 'yolo_textfiles': ''}[input_annotation_format])
+    if os.path.exists(input_path):
+        return input_path
+    label_ids, category_names = synthetic.synthetic_categories(args.num_categories)
+    data = synthetic.make_synthetic_boxes(args.num_boxes, args.boxes_per_image, args.num_categories, args.seed)
+    start_time = time.perf_counter()
+    if input_annotation_format == 'coco_json':
+        synthetic.write_synthetic_coco_json(input_path, data, category_names)
+    elif input_annotation_format == 'oidv6_csv':
+        synthetic.write_synthetic_oid_csv(input_path, data, label_ids)
+    else:
+        # Write to a temporary folder first, so that an interrupted run is not reused
+        tmp_path = input_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        synthetic.write_synthetic_yolo_textfiles(tmp_path, data, category_names)
+        os.replace(tmp_path, input_path)
+    print(f'Generated {input_path} in {time.perf_counter() - start_time:.1f} s', file=sys.stderr)
+    return input_path
+
+
+def benchmark_format(input_annotation_format, input_path, output_dir, args):
+    """Runs the stages of one input format and returns {stage: results}."""
+    results = dict()
+    __, category_names = synthetic.synthetic_categories(args.num_categories)
+    # Only some categories are of interest, like in most conversions
+    categories = category_names[:max(1, round(len(category_names) * args.fraction_of_interest))]
+    quiet = not args.verbose
+
+    def converter(**options):
+        return make_converter(input_annotation_format, input_path, categories, args.num_workers, **options)
+
+    if input_annotation_format == 'coco_json':
+        with timed_stage(results, 'get_coco_json_data', quiet) as counts:
+            __, annotations, images = helpers.get_coco_json_data(input_path)
+            counts['boxes'], counts['files'] = len(annotations), 1
+        del annotations, images
+        with timed_stage(results, 'convert_coco_json_to_dict_streaming', quiet) as counts:
+            converter().convert_coco_json_to_dict(input_path, streaming=True)
+            counts['boxes'], counts['files'] = args.num_boxes, 1
+        with timed_stage(results, 'convert_coco_json_to_dict', quiet) as counts:
+            ac = converter()
+            ac.convert_coco_json_to_dict(input_path, streaming=False)
+            counts['boxes'], counts['files'] = args.num_boxes, 1
+    elif input_annotation_format == 'oidv6_csv':
+        with timed_stage(results, 'convert_oid_csv_to_dict', quiet) as counts:
+            ac = converter()
+            ac.convert_oid_csv_to_dict(input_path)
+            counts['boxes'], counts['files'] = args.num_boxes, 1
+    else:
+        with timed_stage(results, 'convert_yolo_textfiles_to_dict', quiet) as counts:
+            ac = converter(image_sizes=os.path.join(input_path, 'image_sizes.json'))
+            ac.convert_yolo_textfiles_to_dict(os.path.join(input_path, 'labels'))
+            counts['boxes'], counts['files'] = args.num_boxes, ac.annotations.num_images
+
+    store = ac.annotations
+    num_images = len(store.image_indices_with_boxes())
+    with timed_stage(results, 'split_images', quiet) as counts:
+        ac.split_images([0.8, 0.2])
+        counts['boxes'], counts['files'] = len(store), num_images
+    if input_annotation_format != 'yolo_textfiles':
+        with timed_stage(results, 'write_yolo_textfiles', quiet) as counts:
+            ac.write_yolo_textfiles(os.path.join(output_dir, 'yolo_textfiles'))
+            counts['boxes'], counts['files'] = len(store), num_images
+    if input_annotation_format != 'oidv6_csv':  # Images of oidv6_csv inputs have no known size
+        with timed_stage(results, 'write_coco_json', quiet) as counts:
+            ac.write_coco_json(os.path.join(output_dir, 'output.json'))
+            counts['boxes'], counts['files'] = len(store), 1
+    return results
+
+
+def _benchmark_format_process(queue, input_annotation_format, input_path, output_dir, args):
+    """Runs benchmark_format in a child process and puts (results, None) in queue, or (None, traceback) if it raised."""
+    try:
+        queue.put((benchmark_format(input_annotation_format, input_path, output_dir, args), None))
+    except Exception:
+        queue.put((None, traceback.format_exc()))
+
+
+def _get_process_results(queue, process, poll_seconds=1.0):
+    """Waits for the results of a _benchmark_format_process. Raises a RuntimeError if it raised or died without results."""
+    while True:
+        # Checked before waiting: results put by a process that has exited are already in the queue
+        was_alive = process.is_alive()
+        try:
+            format_results, error = queue.get(timeout=poll_seconds)
+            break
+        except Empty:
+            if not was_alive:
+                raise RuntimeError(f'The benchmark process exited with code {process.exitcode} without results')
+    process.join()
+    if error is not None:
+        raise RuntimeError(f'The benchmark process failed:\n{error}')
+    return format_results
+
+
+def run_benchmarks(args):
+    """Runs the benchmarks of each input format in its own process (so that peak memory is measured per format).
+    Returns the results, with the parameters of the run."""
+    results = dict()
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bbox-converter-benchmarks-')
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        for input_annotation_format in args.formats:
+            input_path = generate_dataset(input_annotation_format, data_dir, args)
+            with tempfile.TemporaryDirectory(dir=data_dir) as output_dir:
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(target=_benchmark_format_process, args=(queue, input_annotation_format, input_path, output_dir, args))
+                process.start()
+                results[input_annotation_format] = _get_process_results(queue, process)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    parameters = {key: getattr(args, key) for key in ('num_boxes', 'boxes_per_image', 'num_categories', 'fraction_of_interest', 'num_workers', 'seed')}
+    return {'parameters': parameters, 'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpu_count': os.cpu_count()},
+            'results': results}
+
+
+def compare_to_baseline(run, baseline, tolerance=0.2, min_seconds=0.05):
+    """Compares the wall times of a run to those of a baseline run.
+
+    Returns
+    --------
+
+    rows: list of (input_annotation_format, stage, baseline_seconds, seconds, ratio, regressed)
+        One row per stage of the run that is also in the baseline. A stage regressed when it is more than tolerance slower,
+        and more than min_seconds slower (so that timing noise of very short stages is not reported).
+    """
+    rows = []
+    for input_annotation_format, stages in run['results'].items():
+        for stage, stage_results in stages.items():
+            baseline_results = baseline['results'].get(input_annotation_format, dict()).get(stage)
+            if baseline_results is None or not baseline_results['seconds']:
+                continue
+            ratio = stage_results['seconds'] / baseline_results['seconds']
+            regressed = ratio > 1 + tolerance and stage_results['seconds'] - baseline_results['seconds'] > min_seconds
+            rows.append((input_annotation_format, stage, baseline_results['seconds'], stage_results['seconds'], ratio, regressed))
+    return rows
+
+
+def print_results(run):
+    print(f"{'format':<16}{'stage':<38}{'seconds':>10}{'boxes/s':>14}{'files/s':>12}{'peak RSS MB':>13}")
+    for input_annotation_format, stages in run['results'].items():
+        for stage, r in stages.items():
+            print(f"{input_annotation_format:<16}{stage:<38}{r['seconds']:>10.3f}{r['boxes_per_s'] or 0:>14,.0f}{r['files_per_s'] or 0:>12,.0f}{r['peak_rss_mb']:>13.1f}")
+
+
+def print_comparison(rows):
+    print(f"\n{'format':<16}{'stage':<38}{'baseline s':>11}{'seconds':>10}{'ratio':>8}")
+    for input_annotation_format, stage, baseline_seconds, seconds, ratio, regressed in rows:
+        print(f"{input_annotation_format:<16}{stage:<38}{baseline_seconds:>11.3f}{seconds:>10.3f}{ratio:>8.2f}" + ('  REGRESSION' if regressed else ''))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the converter on synthetic datasets.')
+    parser.add_argument('--num_boxes', type=int, default=100000, help='The number of bboxes of each synthetic dataset. Default: 100000')
+    parser.add_argument('--boxes_per_image', type=int, default=10, help='The average number of bboxes per image. Default: 10')
+    parser.add_argument('--num_categories', type=int, default=100, help='The number of categories of the synthetic datasets. Default: 100')
+    parser.add_argument('--fraction_of_interest', type=float, default=0.5,
+        help='The fraction of the categories that are converted (the most common ones). Default: 0.5')
+    parser.add_argument('--formats', type=str, nargs='+', choices=INPUT_FORMATS, default=list(INPUT_FORMATS), help='The input formats to benchmark. Default: all')
+    parser.add_argument('--num_workers', type=int, default=1, help='The num_workers of the converter. Default: 1')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic datasets. Default: 0')
+    parser.add_argument('--data_dir', type=str, default=None,
+        help='The folder where synthetic datasets are kept and reused between runs. Default: a temporary folder that is deleted after the run')
+    parser.add_argument('--output_json', type=str, default=None, help='Write the results to this json file (e.g., to use it as a baseline later).')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare the results to those of a json file written with --output_json.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='How much slower than the baseline a stage can be before it counts as a regression. Default: 0.2')
+    parser.add_argument('--min_seconds', type=float, default=0.05, help='Stages that are less than this many seconds slower than the baseline never count as a regression. Default: 0.05')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the converter.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    run = run_benchmarks(args)
+    print_results(run)
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(run, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != run['parameters']:
+            print(f"\nWarning: the baseline was run with different parameters: {baseline['parameters']}")
+        rows = compare_to_baseline(run, baseline, args.tolerance, args.min_seconds)
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
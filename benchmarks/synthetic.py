@@ -0,0 +1,115 @@
+import os
+import json
+
+import numpy as np
+
+import helpers.helpers as helpers
+import helpers.constants as c
+
+OID_CSV_HEADER = 'ImageID,Source,LabelName,Confidence,XMin,XMax,YMin,YMax,IsOccluded,IsTruncated,IsGroupOf,IsDepiction,IsInside'
+
+
+def synthetic_categories(num_categories, categories_file=c.OID_CATEGORY_ID_TO_NAME_FILE):
+    """Returns the OID label ids and the standardized names of the first num_categories categories of the OID vocabulary,
+    so that the same categories can be used for every input format."""
+    label_ids, names = [], []
+    with open(categories_file, 'r') as f:
+        for line in f:
+            label_id, name = line.split(',')
+            name = helpers.standardize_string(name)
+            if name in names:
+                continue
+            label_ids.append(label_id)
+            names.append(name)
+            if len(names) == num_categories:
+                break
+    if len(names) < num_categories:
+        raise ValueError(f'The OID vocabulary only has {len(names)} categories')
+    return label_ids, names
+
+
+def make_synthetic_boxes(num_boxes, boxes_per_image=10, num_categories=100, seed=0):
+    """Returns random bboxes grouped by image, with a long-tailed category distribution.
+
+    Returns
+    --------
+
+    dict with
+        image_idx: np.ndarray of int64 (sorted), the image of each bbox
+        category_idx: np.ndarray of int64, the category of each bbox
+        boxes: np.ndarray of float64 with shape (num_boxes, 4), normalized x_min, y_min, x_max, y_max
+        image_widths, image_heights: np.ndarray of int64, the size of each image in pixels
+    """
+    rng = np.random.default_rng(seed)
+    num_images = max(1, -(-num_boxes // boxes_per_image))
+    image_idx = np.sort(rng.integers(0, num_images, num_boxes))
+    # Category k is about 1/(k+1) as frequent as category 0, like most real datasets
+    category_weights = 1 / np.arange(1, num_categories + 1)
+    category_idx = rng.choice(num_categories, size=num_boxes, p=category_weights / category_weights.sum())
+    centers = rng.uniform(0.05, 0.95, size=(num_boxes, 2))
+    sizes = rng.uniform(0.01, 0.5, size=(num_boxes, 2))
+    boxes = np.clip(np.hstack([centers - sizes / 2, centers + sizes / 2]), 0, 1)
+    return {'image_idx': image_idx, 'category_idx': category_idx, 'boxes': boxes,
+            'image_widths': rng.integers(320, 1921, num_images), 'image_heights': rng.integers(240, 1081, num_images)}
+
+
+def synthetic_image_filename(image_idx):
+    return f'{image_idx:016x}.jpg'
+
+
+def _write_rows(f, fmt, columns, separator='', chunk_size=100000):
+    """Writes each row of columns formatted with fmt, with separator between rows, a chunk of rows at a time."""
+    num_rows = len(columns[0])
+    for start in range(0, num_rows, chunk_size):
+        rows = zip(*(column[start:start + chunk_size].tolist() for column in columns))
+        f.write((separator if start else '') + separator.join(fmt % row for row in rows))
+
+
+def write_synthetic_coco_json(output_file, data, category_names):
+    """Writes synthetic bboxes to a json file in the COCO format (category ids are the category indices plus 1)."""
+    boxes, image_idx = data['boxes'], data['image_idx']
+    widths, heights = data['image_widths'], data['image_heights']
+    box_widths, box_heights = widths[image_idx], heights[image_idx]
+    x_min, y_min = boxes[:, 0] * box_widths, boxes[:, 1] * box_heights
+    bbox_widths, bbox_heights = (boxes[:, 2] - boxes[:, 0]) * box_widths, (boxes[:, 3] - boxes[:, 1]) * box_heights
+    categories = [{'id': idx + 1, 'name': name, 'supercategory': 'na'} for idx, name in enumerate(category_names)]
+    image_ids = np.arange(len(widths))
+    with open(output_file, 'w') as f:
+        f.write('{"info":{},"licenses":[],"categories":' + json.dumps(categories) + ',"images":[')
+        _write_rows(f, '{"id":%d,"file_name":"%016x.jpg","width":%d,"height":%d}', [image_ids + 1, image_ids, widths, heights], separator=',')
+        f.write('],"annotations":[')
+        _write_rows(f, '{"id":%d,"image_id":%d,"category_id":%d,"bbox":[%.2f,%.2f,%.2f,%.2f],"area":%.2f,"iscrowd":0}',
+                        [np.arange(len(boxes)) + 1, image_idx + 1, data['category_idx'] + 1, x_min, y_min, bbox_widths, bbox_heights,
+                        bbox_widths * bbox_heights], separator=',')
+        f.write(']}\n')
+
+
+def write_synthetic_oid_csv(output_file, data, label_ids):
+    """Writes synthetic bboxes to a csv file in the Open Images Dataset V6 format."""
+    boxes = data['boxes']
+    with open(output_file, 'w') as f:
+        f.write(OID_CSV_HEADER + '\n')
+        _write_rows(f, '%016x,xclick,%s,1,%.6f,%.6f,%.6f,%.6f,0,0,0,0,0\n',
+                        [data['image_idx'], np.array(label_ids, dtype=object)[data['category_idx']], boxes[:, 0], boxes[:, 2], boxes[:, 1], boxes[:, 3]])
+
+
+def write_synthetic_yolo_textfiles(output_dir, data, category_names):
+    """Writes synthetic bboxes to a folder with one YOLO textfile per image (output_dir/labels), a classes.txt file and an
+    image sizes sidecar file (output_dir/image_sizes.json)."""
+    labels_dir = os.path.join(output_dir, 'labels')
+    os.makedirs(labels_dir, exist_ok=True)
+    with open(os.path.join(labels_dir, 'classes.txt'), 'w') as f:
+        f.write('\n'.join(category_names) + '\n')
+    boxes, image_idx = data['boxes'], data['image_idx']
+    cxcywh = np.hstack([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]])
+    starts = np.flatnonzero(np.r_[True, image_idx[1:] != image_idx[:-1]]) if len(image_idx) else np.empty(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(image_idx)]
+    category_idx = data['category_idx'].tolist()
+    cxcywh = cxcywh.tolist()
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        with open(os.path.join(labels_dir, f'{image_idx[start]:016x}.txt'), 'w') as f:
+            f.write(''.join('%d %.6f %.6f %.6f %.6f\n' % (category_idx[row], *cxcywh[row]) for row in range(start, end)))
+    image_sizes = {synthetic_image_filename(idx): [width, height] for idx, (width, height)
+                    in enumerate(zip(data['image_widths'].tolist(), data['image_heights'].tolist()))}
+    with open(os.path.join(output_dir, 'image_sizes.json'), 'w') as f:
+        json.dump(image_sizes, f)
@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+import hashlib
+
+from helpers.annotation_store import AnnotationStore
+
+# Bump when the saved format of AnnotationStore changes, so that old cache entries are not used anymore
+CACHE_FORMAT_VERSION = 3
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bbox-converter')
+
+
+def hash_file_contents(filepath, block_size=1 << 20):
+    """Returns a hash of the contents of a file."""
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class AnnotationCache():
+    """
+    On-disk cache of parsed (and filtered) input annotations.
+
+    Each entry is an AnnotationStore saved with AnnotationStore.save, so a cache hit only memory-maps a few .npy files
+    instead of parsing json or csv files. Entries are keyed by the input path, its size and modification time (or a hash
+    of its contents), its format and the cleaned list of categories. When the cache grows over max_bytes, the least
+    recently used entries are deleted.
+
+    Attributes
+    ----------
+
+    cache_dir: str
+        The folder where the cache entries are saved.
+
+    max_bytes: int
+        The maximum total size of the cache entries.
+
+    hash_contents: bool
+        Identify input files by a hash of their contents instead of their size and modification time. Slower, but
+        survives `touch` and files re-downloaded or re-extracted to the same path (entries are still keyed by path).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=10 << 30, hash_contents=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+
+    def key(self, input_annotations, input_annotation_format, categories, **options):
+        """Returns the cache key of an input. options are any other settings that change what is parsed."""
+        input_path = os.path.abspath(input_annotations)
+        if self.hash_contents:
+            input_id = hash_file_contents(input_path)
+        else:
+            stat = os.stat(input_path)
+            input_id = [stat.st_size, stat.st_mtime_ns]
+        key_data = [CACHE_FORMAT_VERSION, input_path, input_id, input_annotation_format, list(categories), sorted(options.items())]
+        return hashlib.sha256(json.dumps(key_data, default=str).encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        """Returns the cached AnnotationStore of a key (memory-mapped), or None if it is not cached (or was evicted by another process
+        while it was being loaded)."""
+        entry_dir = self._entry_dir(key)
+        try:
+            os.utime(entry_dir)  # Marks the entry as recently used
+            return AnnotationStore.load(entry_dir, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, store, evict=True):
+        """Saves an AnnotationStore under a key, then evicts old entries if the cache is too large. Processes that share the cache
+        with others of the same run (e.g., input workers) should save with evict=False and leave eviction to the main process."""
+        entry_dir = self._entry_dir(key)
+        # Write to a temporary folder first, so that an interrupted run never leaves a partial entry behind
+        tmp_dir = f'{entry_dir}.tmp{os.getpid()}'
+        store.save(tmp_dir)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # Another process saved the same entry in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if evict:
+            self.evict(keep=key)
+
+    def _entries(self):
+        """Returns (last_used, size_in_bytes, key) for every entry of the cache. Entries deleted by another process meanwhile are skipped."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for entry in os.scandir(self.cache_dir):
+            if '.tmp' in entry.name:
+                continue
+            try:
+                if not entry.is_dir():
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                entries.append((entry.stat().st_mtime, size, entry.name))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """Deletes the least recently used entries until the cache is at most max_bytes (never deletes the entry `keep`)."""
+        entries = sorted(self._entries())
+        total_bytes = sum(size for __, size, __ in entries)
+        for __, size, key in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total_bytes -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,433 @@
+import os
+import json
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+
+FILENAME_COLLISION_OPTIONS = ('merge', 'rename', 'error')
+
+
+class StringColumn():
+    """
+    Read-only list of strings saved as one array of UTF-8 bytes and an array of offsets, used for the image columns of stores
+    loaded with AnnotationStore.load. Fixed-width NumPy string arrays take 4 bytes per character of the longest string,
+    which for image filepaths is many times the size of the bboxes themselves. Strings are decoded when they are accessed.
+
+    Attributes
+    ----------
+
+    data: np.ndarray of uint8
+        The UTF-8 bytes of all the strings, one after the other.
+
+    offsets: np.ndarray of int64 with shape (num_strings + 1,)
+        String i is data[offsets[i]:offsets[i+1]].
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(string).encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        idx = range(len(self))[idx]  # Checks bounds and handles negative indices
+        return self.data[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        data, offsets = self.data.tobytes(), self.offsets.tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class AnnotationStore():
+    """
+    Columnar table of bbox annotations.
+
+    Instead of one python dict per bbox, every bbox is a row spread over a few NumPy columns. Image filenames and
+    original category ids are interned, so each of them is only stored once no matter how many bboxes refer to it.
+    Rows are kept grouped by image, and the boxes of image `i` are the rows `offsets[i]:offsets[i+1]`.
+
+    Attributes
+    ----------
+
+    categories: list of str
+        The categories/classes of interest. category_idx values are indices into this list.
+
+    image_filenames: list of str
+        The interned image filenames. image_idx values are indices into this list. In stores loaded with AnnotationStore.load, 
+        a read-only StringColumn until an image is added.
+
+    image_filepaths: list of str
+        The path to each image, in the same order as image_filenames (also a StringColumn in loaded stores).
+
+    orig_category_ids: list
+        The interned category ids of the input annotations (ints for COCO, label strings for Open Images).
+
+    image_widths, image_heights: np.ndarray of int32
+        The size of each image in pixels, in the same order as image_filenames. 0 when the size is not known.
+
+    image_idx, category_idx, orig_category_idx: np.ndarray of int32
+        One value per bbox.
+
+    boxes: np.ndarray of float32 with shape (num_boxes, 4)
+        One row per bbox with columns x_min, y_min, x_max, y_max, normalized between 0 and 1.
+
+    offsets: np.ndarray of int64 with shape (num_images + 1,)
+        The bboxes of image i are rows offsets[i]:offsets[i+1] of the per-bbox columns.
+    """
+
+    def __init__(self, categories):
+        self.categories = list(categories)
+
+        self.image_filenames = []
+        self.image_filepaths = []
+        self._image_lookup = dict()
+        self._image_widths = array('i')
+        self._image_heights = array('i')
+
+        self.orig_category_ids = []
+        self._orig_category_lookup = dict()
+
+        self._image_idx = np.empty(0, dtype=np.int32)
+        self._category_idx = np.empty(0, dtype=np.int32)
+        self._orig_category_idx = np.empty(0, dtype=np.int32)
+        self._boxes = np.empty((0, 4), dtype=np.float32)
+        self._offsets = None
+        self._pending = []
+
+    def _make_images_mutable(self):
+        """Turns the image columns of a store loaded with AnnotationStore.load back into growable lists."""
+        if not isinstance(self.image_filenames, list):
+            self.image_filenames = self.image_filenames.tolist()
+            self.image_filepaths = self.image_filepaths.tolist()
+            self._image_widths = array('i', np.asarray(self._image_widths, dtype=np.int32).tobytes())
+            self._image_heights = array('i', np.asarray(self._image_heights, dtype=np.int32).tobytes())
+        if self._image_lookup is None:
+            self._image_lookup = {image_filename: image_idx for image_idx, image_filename in enumerate(self.image_filenames)}
+
+    def add_image(self, image_filename, image_filepath, width=0, height=0):
+        """Interns an image and returns its index. Adding an image that already exists returns the existing index."""
+        self._make_images_mutable()
+        image_idx = self._image_lookup.get(image_filename)
+        if image_idx is None:
+            image_idx = len(self.image_filenames)
+            self._image_lookup[image_filename] = image_idx
+            self.image_filenames.append(image_filename)
+            self.image_filepaths.append(image_filepath)
+            self._image_widths.append(int(width))
+            self._image_heights.append(int(height))
+            self._offsets = None
+        elif width and height and not self._image_widths[image_idx]:
+            self._image_widths[image_idx] = int(width)
+            self._image_heights[image_idx] = int(height)
+        return image_idx
+
+    def set_image_sizes(self, image_indices, widths, heights):
+        """Sets the width and height of some images (e.g., probed from the image files)."""
+        self._make_images_mutable()
+        for image_idx, width, height in zip(np.asarray(image_indices).tolist(), np.asarray(widths).tolist(), np.asarray(heights).tolist()):
+            self._image_widths[image_idx] = int(width)
+            self._image_heights[image_idx] = int(height)
+
+    def get_image_index(self, image_filename):
+        """Returns the index of an image, or None if the image is not in the store."""
+        if self._image_lookup is None:
+            self._image_lookup = {image_filename: image_idx for image_idx, image_filename in enumerate(self.image_filenames)}
+        return self._image_lookup.get(image_filename)
+
+    def add_orig_category(self, orig_category_id):
+        """Interns an original category id and returns its index."""
+        orig_category_idx = self._orig_category_lookup.get(orig_category_id)
+        if orig_category_idx is None:
+            orig_category_idx = len(self.orig_category_ids)
+            self._orig_category_lookup[orig_category_id] = orig_category_idx
+            self.orig_category_ids.append(orig_category_id)
+        return orig_category_idx
+
+    def add_boxes(self, image_idx, category_idx, orig_category_idx, boxes):
+        """Appends bboxes to the store.
+
+        Attributes
+        ----------
+
+        image_idx, category_idx, orig_category_idx: int or array-like of int
+            Either one value per bbox, or a single value shared by all the bboxes.
+
+        boxes: array-like with shape (num_boxes, 4)
+            x_min, y_min, x_max, y_max of each bbox, normalized between 0 and 1.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        num_boxes = len(boxes)
+        if num_boxes == 0:
+            return
+        image_idx = np.broadcast_to(np.asarray(image_idx, dtype=np.int32), (num_boxes,))
+        category_idx = np.broadcast_to(np.asarray(category_idx, dtype=np.int32), (num_boxes,))
+        orig_category_idx = np.broadcast_to(np.asarray(orig_category_idx, dtype=np.int32), (num_boxes,))
+        self._pending.append((image_idx, category_idx, orig_category_idx, boxes))
+        self._offsets = None
+
+    def extend(self, other, on_filename_collision='merge', collision_prefix=''):
+        """Appends all the images and bboxes of another store (e.g., the store of another input file).
+
+        Attributes
+        ----------
+
+        other: AnnotationStore
+            The store to append. Its categories are matched to the categories of this store by name.
+
+        on_filename_collision: str
+            What to do when an image of other has the same filename as an image of this store but a different filepath.
+            `merge` treats them as the same image, `rename` adds collision_prefix to the filename of the image of other (and a number
+            if the renamed filename is also taken), and `error` raises a ValueError. Images with the same filename and filepath are
+            always merged.
+
+        collision_prefix: str
+            The prefix of renamed filenames.
+        """
+        if on_filename_collision not in FILENAME_COLLISION_OPTIONS:
+            raise ValueError(f'Unknown filename collision option {on_filename_collision}. Options: {FILENAME_COLLISION_OPTIONS}')
+        category_to_idx = {category: idx for idx, category in enumerate(self.categories)}
+        category_map = np.array([category_to_idx[category] for category in other.categories], dtype=np.int32)
+        orig_category_map = np.array([self.add_orig_category(orig_category_id) for orig_category_id in other.orig_category_ids], dtype=np.int32)
+
+        self._make_images_mutable()
+        image_map = np.empty(other.num_images, dtype=np.int32)
+        for image_idx, (image_filename, image_filepath, width, height) in enumerate(zip(other.image_filenames, other.image_filepaths,
+                                                                                    other.image_widths.tolist(), other.image_heights.tolist())):
+            image_filename, image_filepath = str(image_filename), str(image_filepath)
+            existing_image_idx = self._image_lookup.get(image_filename)
+            if existing_image_idx is not None and self.image_filepaths[existing_image_idx] != image_filepath:
+                if on_filename_collision == 'error':
+                    raise ValueError(f'{image_filepath} and {self.image_filepaths[existing_image_idx]} have the same filename {image_filename}')
+                if on_filename_collision == 'rename':
+                    image_filename = self._unique_filename(collision_prefix, image_filename, image_filepath)
+            image_map[image_idx] = self.add_image(image_filename, image_filepath, width, height)
+
+        if len(other):
+            self.add_boxes(image_map[other.image_idx], category_map[other.category_idx], orig_category_map[other.orig_category_idx], other.boxes)
+
+    def _unique_filename(self, prefix, image_filename, image_filepath):
+        """Returns prefix + image_filename, or prefix + n_ + image_filename with the smallest n that is not the filename of
+        another image (e.g., when several inputs with the same name, and thus the same prefix, have an image with this filename)."""
+        renamed_filename = prefix + image_filename
+        suffix = 1
+        while renamed_filename in self._image_lookup and self.image_filepaths[self._image_lookup[renamed_filename]] != image_filepath:
+            renamed_filename = f'{prefix}{suffix}_{image_filename}'
+            suffix += 1
+        return renamed_filename
+
+    def filter_rows(self, keep, boxes=None):
+        """Keeps only the bboxes of the rows where keep is True. boxes optionally replaces the coordinates of all the bboxes 
+        (e.g., clipped bboxes) before they are filtered."""
+        self._compact()
+        keep = np.asarray(keep, dtype=bool)
+        boxes = self._boxes if boxes is None else np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self._image_idx = self._image_idx[keep]
+        self._category_idx = self._category_idx[keep]
+        self._orig_category_idx = self._orig_category_idx[keep]
+        self._boxes = boxes[keep]
+        self._offsets = None
+
+    def _compact(self):
+        """Merges pending bboxes into the columns and regroups the rows by image."""
+        if self._offsets is not None:
+            return
+        if self._pending:
+            self._image_idx = np.concatenate([self._image_idx] + [p[0] for p in self._pending])
+            self._category_idx = np.concatenate([self._category_idx] + [p[1] for p in self._pending])
+            self._orig_category_idx = np.concatenate([self._orig_category_idx] + [p[2] for p in self._pending])
+            self._boxes = np.concatenate([self._boxes] + [p[3] for p in self._pending])
+            self._pending = []
+
+            if len(self._image_idx) > 1 and np.any(self._image_idx[1:] < self._image_idx[:-1]):
+                order = np.argsort(self._image_idx, kind='stable')
+                self._image_idx = self._image_idx[order]
+                self._category_idx = self._category_idx[order]
+                self._orig_category_idx = self._orig_category_idx[order]
+                self._boxes = self._boxes[order]
+
+        box_counts = np.bincount(self._image_idx, minlength=self.num_images)
+        offsets = np.zeros(self.num_images + 1, dtype=np.int64)
+        np.cumsum(box_counts, out=offsets[1:])
+        self._offsets = offsets
+
+    @property
+    def image_idx(self):
+        self._compact()
+        return self._image_idx
+
+    @property
+    def category_idx(self):
+        self._compact()
+        return self._category_idx
+
+    @property
+    def orig_category_idx(self):
+        self._compact()
+        return self._orig_category_idx
+
+    @property
+    def boxes(self):
+        self._compact()
+        return self._boxes
+
+    @property
+    def offsets(self):
+        self._compact()
+        return self._offsets
+
+    @property
+    def image_widths(self):
+        return np.array(self._image_widths, dtype=np.int32)
+
+    @property
+    def image_heights(self):
+        return np.array(self._image_heights, dtype=np.int32)
+
+    @property
+    def num_images(self):
+        return len(self.image_filenames)
+
+    def __len__(self):
+        """The number of bboxes in the store."""
+        return len(self.image_idx)
+
+    def box_counts(self):
+        """Returns the number of bboxes of each image."""
+        return np.diff(self.offsets)
+
+    def image_indices_with_boxes(self):
+        """Returns the indices of the images that have at least one bbox."""
+        return np.flatnonzero(self.box_counts())
+
+    def image_rows(self, image_idx):
+        """Returns the slice of per-bbox rows that belong to an image."""
+        offsets = self.offsets
+        return slice(int(offsets[image_idx]), int(offsets[image_idx + 1]))
+
+    def rows_for_images(self, image_indices):
+        """Returns the per-bbox row indices of all the bboxes of the given images (in the order of image_indices)."""
+        image_indices = np.asarray(image_indices, dtype=np.int64)
+        offsets = self.offsets
+        starts = offsets[image_indices]
+        counts = offsets[image_indices + 1] - starts
+        # Each row is its image's first row plus its position within the image
+        first_positions = np.cumsum(counts) - counts
+        return np.repeat(starts - first_positions, counts) + np.arange(counts.sum(), dtype=np.int64)
+
+    def category_counts(self):
+        """Returns a dict with the number of bboxes of each category (only for categories with at least one bbox)."""
+        counts = np.bincount(self.category_idx, minlength=len(self.categories))
+        return {category: int(count) for category, count in zip(self.categories, counts) if count}
+
+    def get_image_bboxes(self, image_idx):
+        """Returns the bboxes of an image as a list of dicts with format {category, orig_category_id, image_filepath, x_min, y_min, x_max, y_max}."""
+        rows = self.image_rows(image_idx)
+        image_filepath = self.image_filepaths[image_idx]
+        bboxes = []
+        for category_idx, orig_category_idx, box in zip(self.category_idx[rows].tolist(),
+                                                        self.orig_category_idx[rows].tolist(),
+                                                        self.boxes[rows].tolist()):
+            x_min, y_min, x_max, y_max = box
+            bbox_dict = {'category': self.categories[category_idx], 'orig_category_id': self.orig_category_ids[orig_category_idx],
+                            'image_filepath': image_filepath, 'x_min': x_min, 'y_min': y_min, 'x_max': x_max, 'y_max': y_max}
+            bboxes.append(bbox_dict)
+        return bboxes
+
+
+    def save(self, directory):
+        """Saves the store to a directory, with one .npy file per column so that it can be loaded with memory mapping."""
+        os.makedirs(directory, exist_ok=True)
+        columns = {'image_idx': self.image_idx, 'category_idx': self.category_idx, 'orig_category_idx': self.orig_category_idx,
+                    'boxes': self.boxes, 'offsets': self.offsets, 'image_widths': self.image_widths, 'image_heights': self.image_heights}
+        for name in ('image_filenames', 'image_filepaths'):
+            strings = getattr(self, name)
+            string_column = strings if isinstance(strings, StringColumn) else StringColumn.from_strings(strings)
+            columns[name] = string_column.data
+            columns[name + '_offsets'] = string_column.offsets
+        for name, column in columns.items():
+            np.save(os.path.join(directory, name + '.npy'), column)
+        with open(os.path.join(directory, 'store.json'), 'w') as f:
+            json.dump({'categories': self.categories, 'orig_category_ids': self.orig_category_ids}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Loads a store saved with AnnotationStore.save. With mmap_mode='r', the columns are memory-mapped (read-only) instead of read,
+        so loading takes about the same time no matter how many bboxes there are."""
+        with open(os.path.join(directory, 'store.json'), 'r') as f:
+            metadata = json.load(f)
+        store = cls(metadata['categories'])
+        for orig_category_id in metadata['orig_category_ids']:
+            store.add_orig_category(orig_category_id)
+
+        def load_column(name):
+            return np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+
+        # The image columns stay as arrays until an image is added (see _make_images_mutable)
+        store.image_filenames = StringColumn(load_column('image_filenames'), load_column('image_filenames_offsets'))
+        store.image_filepaths = StringColumn(load_column('image_filepaths'), load_column('image_filepaths_offsets'))
+        store._image_widths = load_column('image_widths')
+        store._image_heights = load_column('image_heights')
+        store._image_lookup = None
+        store._image_idx = load_column('image_idx')
+        store._category_idx = load_column('category_idx')
+        store._orig_category_idx = load_column('orig_category_idx')
+        store._boxes = load_column('boxes')
+        store._offsets = load_column('offsets')
+        return store
+
+
+class AnnotationsDictView(Mapping):
+    """
+    Read-only dict-style view of an AnnotationStore with format {image_filename: [{category, orig_category_id, image_filepath, x_min, x_max, y_min, y_max},],}.
+
+    Only images with at least one bbox are keys. The bbox dicts are built on access, so this view is meant for
+    backward compatibility and inspection rather than for iterating over large datasets.
+
+    Attributes
+    ----------
+
+    store: AnnotationStore
+        The store to look at.
+
+    image_indices: array-like of int
+        Optionally restricts the view to a subset of the images (e.g., one side of a train/test split).
+    """
+
+    def __init__(self, store, image_indices=None):
+        self.store = store
+        self.image_indices = image_indices
+
+    def _indices(self):
+        if self.image_indices is None:
+            return self.store.image_indices_with_boxes()
+        image_indices = np.asarray(self.image_indices, dtype=np.int64)
+        return image_indices[self.store.box_counts()[image_indices] > 0]
+
+    def __getitem__(self, image_filename):
+        image_idx = self.store.get_image_index(image_filename)
+        if image_idx is None or not self.store.box_counts()[image_idx]:
+            raise KeyError(image_filename)
+        if self.image_indices is not None and not np.any(np.asarray(self.image_indices) == image_idx):
+            raise KeyError(image_filename)
+        return self.store.get_image_bboxes(image_idx)
+
+    def __iter__(self):
+        image_filenames = self.store.image_filenames
+        for image_idx in self._indices().tolist():
+            yield image_filenames[image_idx]
+
+    def __len__(self):
+        return len(self._indices())
@@ -0,0 +1,179 @@
+import numpy as np
+
+# The bbox formats that convert_boxes understands. Each bbox is a row of 4 values:
+#   coco: x_min, y_min, bbox_width, bbox_height in pixels
+#   voc:  x_min, y_min, x_max, y_max in pixels
+#   xyxy: x_min, y_min, x_max, y_max normalized between 0 and 1 (the format of AnnotationStore.boxes)
+#   yolo: x_center, y_center, bbox_width, bbox_height normalized between 0 and 1
+#   oid:  x_min, x_max, y_min, y_max normalized between 0 and 1 (the column order of the Open Images csv files)
+BBOX_FORMATS = ('coco', 'voc', 'xyxy', 'yolo', 'oid')
+PIXEL_BBOX_FORMATS = ('coco', 'voc')
+
+
+def _as_boxes(boxes):
+    boxes = np.asarray(boxes)
+    if not np.issubdtype(boxes.dtype, np.floating):
+        boxes = boxes.astype(np.float64)
+    return boxes.reshape(-1, 4)
+
+
+def _image_sizes(widths, heights, dtype):
+    """Returns widths and heights as column vectors so they broadcast against (num_boxes, 2) arrays."""
+    if widths is None or heights is None:
+        raise ValueError('Image widths and heights are needed to convert from or to pixel coordinates')
+    widths = np.asarray(widths, dtype=dtype).reshape(-1, 1)
+    heights = np.asarray(heights, dtype=dtype).reshape(-1, 1)
+    return widths, heights
+
+
+def xywh_pixels_to_xyxy_normalized(boxes, widths, heights):
+    """Converts COCO bboxes (x_min, y_min, bbox_width, bbox_height in pixels) to normalized x_min, y_min, x_max, y_max.
+    widths and heights are either one value per bbox or a single value for all of them."""
+    boxes = _as_boxes(boxes)
+    widths, heights = _image_sizes(widths, heights, boxes.dtype)
+    out = np.empty_like(boxes)
+    out[:, 0:1] = boxes[:, 0:1] / widths
+    out[:, 1:2] = boxes[:, 1:2] / heights
+    out[:, 2:3] = (boxes[:, 0:1] + boxes[:, 2:3]) / widths
+    out[:, 3:4] = (boxes[:, 1:2] + boxes[:, 3:4]) / heights
+    return out
+
+
+def xyxy_normalized_to_xywh_pixels(boxes, widths, heights):
+    """Converts normalized x_min, y_min, x_max, y_max bboxes to COCO bboxes (x_min, y_min, bbox_width, bbox_height in pixels)."""
+    boxes = _as_boxes(boxes)
+    widths, heights = _image_sizes(widths, heights, boxes.dtype)
+    out = np.empty_like(boxes)
+    out[:, 0:1] = boxes[:, 0:1] * widths
+    out[:, 1:2] = boxes[:, 1:2] * heights
+    out[:, 2:3] = (boxes[:, 2:3] - boxes[:, 0:1]) * widths
+    out[:, 3:4] = (boxes[:, 3:4] - boxes[:, 1:2]) * heights
+    return out
+
+
+def xyxy_pixels_to_xyxy_normalized(boxes, widths, heights):
+    """Converts VOC bboxes (x_min, y_min, x_max, y_max in pixels) to normalized x_min, y_min, x_max, y_max."""
+    boxes = _as_boxes(boxes)
+    widths, heights = _image_sizes(widths, heights, boxes.dtype)
+    out = np.empty_like(boxes)
+    out[:, 0::2] = boxes[:, 0::2] / widths
+    out[:, 1::2] = boxes[:, 1::2] / heights
+    return out
+
+
+def xyxy_normalized_to_xyxy_pixels(boxes, widths, heights):
+    """Converts normalized x_min, y_min, x_max, y_max bboxes to VOC bboxes (x_min, y_min, x_max, y_max in pixels)."""
+    boxes = _as_boxes(boxes)
+    widths, heights = _image_sizes(widths, heights, boxes.dtype)
+    out = np.empty_like(boxes)
+    out[:, 0::2] = boxes[:, 0::2] * widths
+    out[:, 1::2] = boxes[:, 1::2] * heights
+    return out
+
+
+def xyxy_to_cxcywh(boxes):
+    """Converts normalized x_min, y_min, x_max, y_max bboxes to YOLO bboxes (x_center, y_center, bbox_width, bbox_height)."""
+    boxes = _as_boxes(boxes)
+    out = np.empty_like(boxes)
+    out[:, 0:2] = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+    out[:, 2:4] = boxes[:, 2:4] - boxes[:, 0:2]
+    return out
+
+
+def cxcywh_to_xyxy(boxes):
+    """Converts YOLO bboxes (x_center, y_center, bbox_width, bbox_height) to normalized x_min, y_min, x_max, y_max."""
+    boxes = _as_boxes(boxes)
+    out = np.empty_like(boxes)
+    half_sizes = boxes[:, 2:4] / 2
+    out[:, 0:2] = boxes[:, 0:2] - half_sizes
+    out[:, 2:4] = boxes[:, 0:2] + half_sizes
+    return out
+
+
+def oid_to_xyxy(boxes):
+    """Reorders Open Images bboxes (x_min, x_max, y_min, y_max) to x_min, y_min, x_max, y_max."""
+    return _as_boxes(boxes)[:, [0, 2, 1, 3]]
+
+
+def xyxy_to_oid(boxes):
+    """Reorders x_min, y_min, x_max, y_max bboxes to the Open Images column order (x_min, x_max, y_min, y_max)."""
+    return _as_boxes(boxes)[:, [0, 2, 1, 3]]
+
+
+def clip_xyxy(boxes):
+    """Clips normalized x_min, y_min, x_max, y_max bboxes to the image (i.e., between 0 and 1)."""
+    return np.clip(_as_boxes(boxes), 0, 1)
+
+
+def nondegenerate_mask(boxes):
+    """Returns a boolean mask of the x_min, y_min, x_max, y_max bboxes that have a positive width and height."""
+    boxes = _as_boxes(boxes)
+    return (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+
+
+_TO_XYXY = {
+    'coco': xywh_pixels_to_xyxy_normalized,
+    'voc': xyxy_pixels_to_xyxy_normalized,
+    'xyxy': lambda boxes, widths, heights: _as_boxes(boxes),
+    'yolo': lambda boxes, widths, heights: cxcywh_to_xyxy(boxes),
+    'oid': lambda boxes, widths, heights: oid_to_xyxy(boxes),
+}
+
+_FROM_XYXY = {
+    'coco': xyxy_normalized_to_xywh_pixels,
+    'voc': xyxy_normalized_to_xyxy_pixels,
+    'xyxy': lambda boxes, widths, heights: boxes,
+    'yolo': lambda boxes, widths, heights: xyxy_to_cxcywh(boxes),
+    'oid': lambda boxes, widths, heights: xyxy_to_oid(boxes),
+}
+
+
+def convert_boxes(boxes, source_format, target_format, widths=None, heights=None, clip=False, drop_degenerate=False):
+    """Converts a whole array of bboxes from one format to another in a few vectorized operations.
+
+    Attributes
+    ----------
+
+    boxes: array-like with shape (num_boxes, 4)
+        The bboxes in source_format.
+
+    source_format, target_format: str
+        One of BBOX_FORMATS.
+
+    widths, heights: array-like or number
+        The size in pixels of the image of each bbox (or a single size for all of them). Only needed when
+        source_format or target_format is in pixels (coco or voc).
+
+    clip: bool
+        Clips the bboxes to the image before converting them to target_format.
+
+    drop_degenerate: bool
+        Drops the bboxes with a width or height of 0 or less (checked after clipping).
+
+    Returns
+    --------
+
+    boxes: np.ndarray with shape (num_kept_boxes, 4)
+        The bboxes in target_format.
+
+    keep: np.ndarray of bool with shape (num_boxes,)
+        Which input bboxes are in the output (all True unless drop_degenerate is used).
+        Use it to filter any other per-bbox columns.
+    """
+    for bbox_format in (source_format, target_format):
+        if bbox_format not in BBOX_FORMATS:
+            raise ValueError(f'Unknown bbox format {bbox_format}. Options: {BBOX_FORMATS}')
+
+    xyxy = _TO_XYXY[source_format](boxes, widths, heights)
+    if clip:
+        xyxy = clip_xyxy(xyxy)
+    keep = nondegenerate_mask(xyxy) if drop_degenerate else np.ones(len(xyxy), dtype=bool)
+
+    if target_format in PIXEL_BBOX_FORMATS:
+        widths, heights = _image_sizes(widths, heights, xyxy.dtype)
+        if drop_degenerate:
+            widths = widths[keep] if len(widths) > 1 else widths
+            heights = heights[keep] if len(heights) > 1 else heights
+    if drop_degenerate:
+        xyxy = xyxy[keep]
+    return _FROM_XYXY[target_format](xyxy, widths, heights), keep
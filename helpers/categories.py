@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import functools
+from types import MappingProxyType
+
+import numpy as np
+
+import helpers.helpers as helpers
+import helpers.constants as c
+
+# Bump when the saved format of vocabularies changes
+VOCABULARY_CACHE_VERSION = 1
+
+
+def load_oid_vocabulary(categories_file=c.OID_CATEGORY_ID_TO_NAME_FILE, cache_dir=None):
+    """Returns a read-only dict {category_id: standardized category name} of an OID categories file (lines `category_id,category_name`).
+
+    Each file is parsed once per process (until it is modified), and when cache_dir is given, the parsed vocabulary is also
+    saved there so that other runs only load a json file.
+    """
+    stat = os.stat(categories_file)
+    return _load_oid_vocabulary(os.path.abspath(categories_file), stat.st_mtime_ns, stat.st_size, cache_dir)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_oid_vocabulary(categories_file, mtime_ns, size, cache_dir):
+    cache_file = None
+    if cache_dir:
+        key = hashlib.sha256(json.dumps([VOCABULARY_CACHE_VERSION, categories_file, mtime_ns, size]).encode()).hexdigest()
+        cache_file = os.path.join(cache_dir, 'vocabularies', key + '.json')
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return MappingProxyType(json.load(f))
+
+    vocabulary = dict()
+    with open(categories_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            category_id, category = line.split(',', 1)
+            vocabulary[category_id] = helpers.standardize_string(category)
+
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f'{cache_file}.tmp{os.getpid()}'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(vocabulary, f)
+        os.replace(tmp_file, cache_file)
+    return MappingProxyType(vocabulary)
+
+
+def read_category_aliases_file(aliases_file):
+    """Reads a json file {source category name: category} of aliases (e.g., {"puppy": "dog"})."""
+    with open(aliases_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_oid_hierarchy_file(hierarchy_file):
+    """Reads an OID hierarchy json file (e.g., bbox_labels_600_hierarchy.json), a tree of {"LabelName": ..., "Subcategory": [...]}."""
+    with open(hierarchy_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class CategoryRegistry():
+    """
+    Maps the category ids and names of the inputs to the output categories, with O(1) lookups.
+
+    Each output category has an index (its position in categories, used as the YOLO class int and COCO category id of outputs).
+    Source names are matched to output categories by their standardized name, or through aliases, which map other source
+    names onto an output category (e.g., several OID labels onto one class). Output categories always keep their own index,
+    even when they are also the alias of another category.
+
+    Attributes
+    ----------
+
+    categories: list of str
+        The output categories (standardized).
+
+    aliases: dict
+        {source category name: category}. Default: None (no aliases)
+    """
+
+    def __init__(self, categories, aliases=None):
+        self.categories = list(categories)
+        self.category_to_idx = {category: idx for idx, category in enumerate(self.categories)}
+        self.aliases = dict()
+        self.name_to_idx = dict(self.category_to_idx)
+        if aliases:
+            self.add_aliases(aliases)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def __contains__(self, name):
+        return name in self.name_to_idx
+
+    def add_aliases(self, aliases):
+        """Adds aliases {source category name: category}. Raises a ValueError for aliases of a category that is not an output category."""
+        for alias, category in aliases.items():
+            alias, category = helpers.standardize_string(alias), helpers.standardize_string(category)
+            if category not in self.category_to_idx:
+                raise ValueError(f'{alias} is an alias of {category}, which is not one of the categories: {self.categories}')
+            if alias in self.category_to_idx:
+                continue
+            self.aliases[alias] = category
+            self.name_to_idx[alias] = self.category_to_idx[category]
+
+    def add_oid_hierarchy(self, hierarchy, vocabulary):
+        """Rolls up an OID hierarchy: every label under an output category (that is not an output category itself) becomes an alias
+        of its nearest output ancestor. vocabulary maps the LabelName ids of the hierarchy to names (see load_oid_vocabulary)."""
+        aliases = dict()
+
+        def roll_up(node, ancestor):
+            name = vocabulary.get(node['LabelName'], node['LabelName'])
+            if name in self.category_to_idx:
+                ancestor = name
+            elif ancestor is not None and name not in self.aliases:
+                aliases.setdefault(name, ancestor)
+            for child in node.get('Subcategory', []):
+                roll_up(child, ancestor)
+
+        roll_up(hierarchy, None)
+        self.add_aliases(aliases)
+
+    def index(self, name, default=-1):
+        """Returns the index of the output category of a standardized source name, or default if it is not of interest."""
+        return self.name_to_idx.get(name, default)
+
+    def indices(self, names):
+        """Returns the index of the output category of each standardized source name (np.ndarray of int32, -1 for names that are not of interest)."""
+        return np.array([self.name_to_idx.get(name, -1) for name in names], dtype=np.int32)
+
+    def name(self, idx):
+        return self.categories[idx]
+
+    def source_id_map(self, source_id_to_name):
+        """Returns {source id: index of the output category} for the source categories of interest, given {source id: standardized name}
+        (e.g., the categories of a COCO file or an OID vocabulary)."""
+        name_to_idx = self.name_to_idx
+        return {source_id: name_to_idx[name] for source_id, name in source_id_to_name.items() if name in name_to_idx}
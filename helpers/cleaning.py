@@ -0,0 +1,132 @@
+import numpy as np
+
+import helpers.bbox_formats as bbox_formats
+
+# The reasons a bbox can be removed for, in the order they are checked
+REMOVAL_REASONS = ('degenerate', 'too_small', 'extreme_aspect_ratio', 'duplicate')
+
+
+def pairwise_iou(boxes_a, boxes_b):
+    """Returns the IoU of each pair of x_min, y_min, x_max, y_max bboxes (boxes_a[i], boxes_b[i])."""
+    intersection_widths = np.clip(np.minimum(boxes_a[:, 2], boxes_b[:, 2]) - np.maximum(boxes_a[:, 0], boxes_b[:, 0]), 0, None)
+    intersection_heights = np.clip(np.minimum(boxes_a[:, 3], boxes_b[:, 3]) - np.maximum(boxes_a[:, 1], boxes_b[:, 1]), 0, None)
+    intersections = intersection_widths * intersection_heights
+    areas_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    areas_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    unions = areas_a + areas_b - intersections
+    return np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+
+def duplicate_mask(boxes, group_keys, iou_threshold, pairs_per_batch=1 << 22):
+    """Returns a boolean mask of the bboxes that duplicate an earlier kept bbox of the same group (e.g., the same image and category),
+    i.e., that overlap it with an IoU of at least iou_threshold.
+
+    All the pairs of bboxes of each group are compared in batches of vectorized IoU computations. Only the few pairs over the
+    threshold are then resolved in order, so that a bbox that was itself removed does not remove others.
+    """
+    num_boxes = len(boxes)
+    if num_boxes < 2:
+        return np.zeros(num_boxes, dtype=bool)
+    order = np.argsort(group_keys, kind='stable')
+    sorted_keys = group_keys[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, num_boxes])
+    group_ends = np.repeat(group_starts + group_sizes, group_sizes)
+    # Each sorted bbox is compared with the bboxes after it in its group
+    pair_counts = group_ends - np.arange(num_boxes) - 1
+
+    first_rows, second_rows = [], []
+    batch_start = 0
+    while batch_start < num_boxes:
+        # Take as many bboxes as fit in one batch of pairs (at least one)
+        cumulative_pairs = np.cumsum(pair_counts[batch_start:])
+        batch_end = batch_start + max(1, int(np.searchsorted(cumulative_pairs, pairs_per_batch, side='right')))
+        counts = pair_counts[batch_start:batch_end]
+        total = int(counts.sum())
+        if total:
+            firsts = np.repeat(np.arange(batch_start, batch_end), counts)
+            seconds = firsts + 1 + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            overlapping = pairwise_iou(boxes[order[firsts]], boxes[order[seconds]]) >= iou_threshold
+            first_rows.append(order[firsts[overlapping]])
+            second_rows.append(order[seconds[overlapping]])
+        batch_start = batch_end
+
+    removed = np.zeros(num_boxes, dtype=bool)
+    if not first_rows:
+        return removed
+    first_rows, second_rows = np.concatenate(first_rows), np.concatenate(second_rows)
+    # Visit the pairs in the order of the bbox that may be removed; rows within a group keep their order, so first rows come before second rows
+    pair_order = np.lexsort((first_rows, second_rows))
+    for first_row, second_row in zip(first_rows[pair_order].tolist(), second_rows[pair_order].tolist()):
+        if not removed[first_row]:
+            removed[second_row] = True
+    return removed
+
+
+def clean_annotations(store, min_box_area=0.0, max_aspect_ratio=None, dedup_iou=None):
+    """Clips the bboxes of an AnnotationStore to their image, and removes invalid, tiny, extremely elongated and duplicate bboxes
+    (in place). All the checks are vectorized over the whole store.
+
+    Attributes
+    ----------
+
+    store: AnnotationStore
+        The bboxes to clean.
+
+    min_box_area: float
+        bboxes with an area smaller than this fraction of their image are removed. bboxes with no area are always removed.
+
+    max_aspect_ratio: float
+        bboxes that are more than this many times longer than wide (or wider than long) are removed. Uses pixels when the size of
+        the image is known. Default: None (no limit)
+
+    dedup_iou: float
+        bboxes that overlap an earlier bbox of the same image and category with an IoU of at least dedup_iou are removed.
+        Default: None (no de-duplication)
+
+    Returns
+    --------
+
+    report: dict
+        {'clipped': {category: count}, 'removed': {reason: {category: count}}}, with the reasons of REMOVAL_REASONS. A bbox is only
+        counted for the first reason it is removed for.
+    """
+    boxes = store.boxes
+    category_idx = store.category_idx
+    clipped_boxes = bbox_formats.clip_xyxy(boxes)
+    clipped = np.any(clipped_boxes != boxes, axis=1)
+
+    widths = clipped_boxes[:, 2] - clipped_boxes[:, 0]
+    heights = clipped_boxes[:, 3] - clipped_boxes[:, 1]
+    removal_masks = {'degenerate': ~bbox_formats.nondegenerate_mask(clipped_boxes), 'too_small': widths * heights < min_box_area}
+    if max_aspect_ratio is not None:
+        image_widths, image_heights = store.image_widths[store.image_idx], store.image_heights[store.image_idx]
+        has_size = (image_widths > 0) & (image_heights > 0)
+        pixel_widths = np.where(has_size, widths * image_widths, widths)
+        pixel_heights = np.where(has_size, heights * image_heights, heights)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aspect_ratios = np.maximum(pixel_widths / pixel_heights, pixel_heights / pixel_widths)
+        removal_masks['extreme_aspect_ratio'] = aspect_ratios > max_aspect_ratio
+
+    removed = np.zeros(len(boxes), dtype=bool)
+    reasons = np.full(len(boxes), -1, dtype=np.int8)
+    for reason_idx, reason in enumerate(REMOVAL_REASONS[:-1]):
+        if reason in removal_masks:
+            newly_removed = removal_masks[reason] & ~removed
+            reasons[newly_removed] = reason_idx
+            removed |= newly_removed
+    if dedup_iou is not None:
+        kept_rows = np.flatnonzero(~removed)
+        group_keys = store.image_idx[kept_rows].astype(np.int64) * max(len(store.categories), 1) + category_idx[kept_rows]
+        duplicates = kept_rows[duplicate_mask(clipped_boxes[kept_rows], group_keys, dedup_iou)]
+        reasons[duplicates] = REMOVAL_REASONS.index('duplicate')
+        removed[duplicates] = True
+
+    def counts_per_category(mask):
+        counts = np.bincount(category_idx[mask], minlength=len(store.categories))
+        return {category: int(count) for category, count in zip(store.categories, counts) if count}
+
+    report = {'clipped': counts_per_category(clipped & ~removed),
+                'removed': {reason: counts_per_category(reasons == reason_idx) for reason_idx, reason in enumerate(REMOVAL_REASONS)}}
+    store.filter_rows(~removed, clipped_boxes)
+    return report
@@ -0,0 +1,232 @@
+import re
+import json
+import codecs
+
+import helpers.helpers as helpers
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+
+
+class _JsonStream():
+    """
+    Minimal incremental JSON tokenizer over a binary file.
+
+    Only a small window of the file is decoded at a time. Values are either decoded one at a time with
+    json.JSONDecoder.raw_decode (e.g., one element of an array), or skipped without building any python objects.
+    """
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._json_decoder = json.JSONDecoder()
+        self._reset(0)
+
+    def _reset(self, offset):
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._buffer_offset = offset  # The byte offset of self._buffer[0] in the file
+        self._eof = False
+
+    def _read_more(self, size=None):
+        """Drops the consumed part of the buffer and reads the next chunk of the file. Returns False at the end of the file."""
+        if self._eof:
+            return False
+        if self._pos:
+            consumed = self._buffer[:self._pos]
+            self._buffer_offset += len(consumed) if consumed.isascii() else len(consumed.encode('utf-8'))
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        data = self._f.read(size or self._chunk_size)
+        if not data:
+            self._eof = True
+            self._buffer += self._text_decoder.decode(b'', final=True)
+            return False
+        self._buffer += self._text_decoder.decode(data)
+        return True
+
+    def seek(self, offset):
+        self._f.seek(offset)
+        self._reset(offset)
+
+    def tell(self):
+        """Returns the byte offset of the current position in the file."""
+        consumed = self._buffer[:self._pos]
+        return self._buffer_offset + (len(consumed) if consumed.isascii() else len(consumed.encode('utf-8')))
+
+    def peek(self):
+        """Skips whitespace and returns the next character (or '' at the end of the file) without consuming it."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'Expected {char!r} at byte {self.tell()} but found {found!r}')
+        self._pos += 1
+
+    def read_value(self):
+        """Decodes the next JSON value."""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+                # A number at the very end of the buffer might continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Grow the reads so that decoding a value larger than a chunk is not quadratic
+            self._read_more(size)
+            size *= 2
+
+    def skip_value(self):
+        """Skips the next JSON value without decoding it."""
+        if self.peek() not in '[{':
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self._buffer, self._pos)
+            if match is None:
+                self._pos = len(self._buffer)
+                if not self._read_more():
+                    raise ValueError('Unexpected end of JSON file')
+                continue
+            char = match.group()
+            if char == '"':
+                string_end = _STRING_REST.match(self._buffer, match.end())
+                if string_end is None:
+                    # The string continues in the next chunk, so read it again from its opening quote
+                    self._pos = match.start()
+                    if not self._read_more():
+                        raise ValueError('Unexpected end of JSON file')
+                    continue
+                self._pos = string_end.end()
+            elif char in '[{':
+                depth += 1
+                self._pos = match.end()
+            else:
+                depth -= 1
+                self._pos = match.end()
+                if depth == 0:
+                    return
+
+    def iter_object_keys(self):
+        """Iterates over the keys of a JSON object. After each key, the caller must consume (read or skip) its value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self._pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def iter_array(self):
+        """Decodes the elements of a JSON array one at a time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.peek() == ',':
+                self._pos += 1
+            else:
+                self.expect(']')
+                return
+
+
+class CocoJsonStreamReader():
+    """
+    Reads a json file in the COCO format incrementally, so that peak memory does not grow with the number of annotations.
+
+    A first pass decodes the `categories` and `images` sections and only remembers where the `annotations` section
+    starts (it usually comes before `categories`, so it is skipped over without being decoded). The annotations are
+    then decoded from that position and yielded in chunks.
+
+    Attributes
+    ----------
+
+    json_file: str
+        The path to the json file in the COCO format.
+
+    chunk_size: int
+        The number of bytes read from the file at a time.
+    """
+
+    def __init__(self, json_file, chunk_size=1 << 20):
+        self.json_file = json_file
+        self.chunk_size = chunk_size
+        self._annotations_offset = None
+
+    def read_categories_and_images(self):
+        """Returns the categories (with standardized names, as in helpers.get_coco_json_data) and a dict
+        {image_id: (file_name, width, height)} for the images.
+        """
+        categories, images = [], dict()
+        found_sections = set()
+        with open(self.json_file, 'rb') as f:
+            stream = _JsonStream(f, self.chunk_size)
+            for key in stream.iter_object_keys():
+                if key == 'categories':
+                    categories = stream.read_value()
+                    for cat in categories:
+                        cat['name'] = helpers.standardize_string(cat['name'])
+                elif key == 'images':
+                    for img in stream.iter_array():
+                        images[img['id']] = (img['file_name'], img['width'], img['height'])
+                elif key == 'annotations':
+                    self._annotations_offset = stream.tell()
+                    stream.skip_value()
+                else:
+                    stream.skip_value()
+                    continue
+                found_sections.add(key)
+                if len(found_sections) == 3:
+                    break
+        return categories, images
+
+    def iter_annotation_chunks(self, category_ids=None, annotations_per_chunk=10000):
+        """Yields the annotations in lists of up to annotations_per_chunk annotations.
+
+        Attributes
+        ----------
+
+        category_ids: set
+            When given, only the annotations with a category_id in this set are kept (they are filtered as they are decoded).
+
+        annotations_per_chunk: int
+            The maximum number of annotations in each yielded list.
+        """
+        if self._annotations_offset is None:
+            self.read_categories_and_images()
+        if self._annotations_offset is None:
+            return
+        chunk = []
+        with open(self.json_file, 'rb') as f:
+            stream = _JsonStream(f, self.chunk_size)
+            stream.seek(self._annotations_offset)
+            for annotation in stream.iter_array():
+                if category_ids is None or annotation['category_id'] in category_ids:
+                    chunk.append(annotation)
+                    if len(chunk) >= annotations_per_chunk:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
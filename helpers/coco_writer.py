@@ -0,0 +1,110 @@
+import json
+
+import numpy as np
+from tqdm import tqdm
+
+import helpers.bbox_formats as bbox_formats
+
+COCO_INFO = {'year': 2022, 'version': 1.0, 'description': 'created with dataset API', 'contributor': 'na', 'url': 'na', 'date_created': 'na'}
+COCO_LICENSES = [{'url':'N/A', 'id': 1, 'name': 'N/A'}]
+
+
+def write_coco_json(store, output_file, image_indices=None, indent=None, pixel_precision=2, images_per_chunk=10000):
+    """Writes the bboxes of an AnnotationStore to a json file in the COCO format, one chunk of images at a time.
+
+    The `images` and then the `annotations` arrays are written incrementally, so memory does not grow with the number
+    of images. Ids are stable for a given store: the id of an image is its index in the store plus 1, and the id of an
+    annotation is its row in the store plus 1 (so ids stay unique across the files of a train/val split).
+    Category ids are indices into store.categories, like YOLO class ints.
+
+    Attributes
+    ----------
+
+    store: AnnotationStore
+        The bboxes to write. Images need a known width and height (bboxes are written in pixels); images without
+        one are skipped.
+
+    output_file: str
+        The path to the json file.
+
+    image_indices: array-like of int
+        The images to write. Default: all images with at least one bbox.
+
+    indent: int
+        Indentation of the json file. Default: None, which writes compact json with no whitespace.
+
+    pixel_precision: int
+        The number of decimals of bbox coordinates and areas (in pixels).
+
+    images_per_chunk: int
+        The number of images encoded at a time.
+
+    Returns
+    --------
+
+    num_images, num_annotations, num_skipped_images: int
+    """
+    if image_indices is None:
+        image_indices = store.image_indices_with_boxes()
+    image_indices = np.asarray(image_indices, dtype=np.int64)
+    image_widths, image_heights = store.image_widths, store.image_heights
+    has_size = (image_widths[image_indices] > 0) & (image_heights[image_indices] > 0)
+    num_skipped_images = int(np.count_nonzero(~has_size))
+    image_indices = image_indices[has_size]
+    box_counts = store.box_counts()
+
+    separators = (',', ':') if indent is None else (',', ': ')
+
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False, indent=indent, separators=separators)
+
+    def write_array(f, key, chunks):
+        """Writes `"key": [...]` with the elements of each chunk encoded together."""
+        f.write(f',{dumps(key)}:[')
+        first = True
+        for records in chunks:
+            if not records:
+                continue
+            if not first:
+                f.write(',')
+            # Encoding a whole chunk at once is much faster than one json.dumps per record
+            f.write(dumps(records)[1:-1].strip())
+            first = False
+        f.write(']')
+
+    def image_chunks():
+        for start in range(0, len(image_indices), images_per_chunk):
+            yield image_indices[start:start + images_per_chunk]
+
+    def image_records():
+        for chunk_image_indices in image_chunks():
+            yield [{'id': image_idx + 1, 'license': 1, 'file_name': str(store.image_filenames[image_idx]), 'height': int(image_heights[image_idx]),
+                    'width': int(image_widths[image_idx]), 'date_captured': 'na'} for image_idx in chunk_image_indices.tolist()]
+
+    num_annotations = 0
+
+    def annotation_records():
+        nonlocal num_annotations
+        for chunk_image_indices in tqdm(list(image_chunks()), unit=' chunks'):
+            rows = store.rows_for_images(chunk_image_indices)
+            chunk_box_counts = box_counts[chunk_image_indices]
+            coco_bboxes, __ = bbox_formats.convert_boxes(store.boxes[rows].astype(np.float64), 'xyxy', 'coco',
+                                                        np.repeat(image_widths[chunk_image_indices], chunk_box_counts),
+                                                        np.repeat(image_heights[chunk_image_indices], chunk_box_counts))
+            areas = np.round(coco_bboxes[:, 2] * coco_bboxes[:, 3], pixel_precision)
+            coco_bboxes = np.round(coco_bboxes, pixel_precision)
+            image_ids = np.repeat(chunk_image_indices + 1, chunk_box_counts)
+            num_annotations += len(rows)
+            yield [{'id': row + 1, 'image_id': image_id, 'bbox': bbox, 'segmentation': [], 'area': area, 'iscrowd': 0, 'category_id': category_idx}
+                    for row, image_id, bbox, area, category_idx in zip(rows.tolist(), image_ids.tolist(), coco_bboxes.tolist(), areas.tolist(),
+                                                                        store.category_idx[rows].tolist())]
+
+    categories = [{'id': idx, 'name': category, 'supercategory': 'na'} for idx, category in enumerate(store.categories)]
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('{' + dumps('info') + ':' + dumps(COCO_INFO))
+        f.write(',' + dumps('licenses') + ':' + dumps(COCO_LICENSES))
+        f.write(',' + dumps('categories') + ':' + dumps(categories))
+        write_array(f, 'images', image_records())
+        write_array(f, 'annotations', annotation_records())
+        f.write('}\n')
+    return len(image_indices), num_annotations, num_skipped_images
@@ -1,20 +1,43 @@
 import os
-import csv
-import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 #import yaml
-import random
 from tqdm import tqdm
-from pathlib import Path
 
-from collections import defaultdict
+import numpy as np
 import helpers.helpers as helpers
+import helpers.bbox_formats as bbox_formats
+import helpers.yolo_writer as yolo_writer
+import helpers.oid_csv as oid_csv
+import helpers.yolo_reader as yolo_reader
+import helpers.coco_writer as coco_writer
+import helpers.splitter as splitter
+import helpers.cleaning as cleaning
+from helpers.image_probe import ImageSizeIndex
+from helpers.annotation_store import AnnotationStore, AnnotationsDictView
+from helpers.coco_stream import CocoJsonStreamReader
+from helpers.annotation_cache import AnnotationCache
+from helpers.pipeline import YoloPipelineWriter
+from helpers.metrics import MetricsRecorder, NullMetricsRecorder
+from helpers.categories import CategoryRegistry, load_oid_vocabulary, read_category_aliases_file, read_oid_hierarchy_file
+
+def _read_input_shard(config, input_annotations, shard_dir):
+    """Parses one input in a worker process and saves the resulting AnnotationStore to shard_dir. 
+    Returns shard_dir and the category counts of the input."""
+    ac = AnnotationConverter(dict(config, input_annotations=input_annotations))
+    ac._evict_cache = False
+    ac.read_input_file(input_annotations)
+    ac.annotations.save(shard_dir)
+    return shard_dir, ac.category_count_dict
+
 
 class AnnotationConverter():
     """
     Convert bbox annotations between different formats. 
     
-    First converts to all_annotations_dict with format {image_filename: [{category, orig_category_id, new_category_id, x_min, x_max, y_min, y_max},],},
-    where each element of the list corresponds to a different bbox
+    First converts to self.annotations, a columnar AnnotationStore with one row per bbox (see helpers/annotation_store.py).
+    For backward compatibility, all_annotations_dict gives a read-only dict-style view of it with format 
+    {image_filename: [{category, orig_category_id, image_filepath, x_min, x_max, y_min, y_max},],}, where each element of the list corresponds to a different bbox
 
     Attributes
     ----------
@@ -23,25 +46,134 @@ class AnnotationConverter():
         The specific categories/classes we want to utilize
 
     intput_annotation_format: str
-        The style of the annotations that we want to convert into a different style. Options: coco_json, yolo_textfiles, oidv6_csv, all_files. (yolo_textfiles not implemented yet). Default: coco_json.
+        The style of the annotations that we want to convert into a different style. Options: coco_json, yolo_textfiles, oidv6_csv, all_files. Default: coco_json.
+
+    input_annotations: str or list of str
+        The path to the input annotations. When input_annotation_format is coco_json or oidv6_csv, this is a file. When input_annotation_format is yolo_textfiles, this is a folder. 
+        Can also be a glob pattern or a list of paths/patterns, in which case the inputs are parsed in parallel and merged. Default: ./examples/coco_example.json
 
-    input_annotations: str
-        The path to the input annotations. When input_annotation_format is coco_json or oidv6_csv, this is a file. When input_annotation_format is yolo_textfiles, this is a folder (not implemented yet). Default: ./examples/coco_example.json
+    on_filename_collision: str
+        What to do when images of different inputs have the same filename but a different filepath. Options: rename (prefix the filename with the name of its input), 
+        merge (treat them as the same image), error. Default: rename
 
     output_annotation_format: str
         The style of the annotations that we want to convert the original annotations into. Options: coco_json, yolo_textfiles, oidv6_csv. Default: yolo_textfiles
 
     output_annotations: str
-        The path to the output annotations. When output_annotation_format is coco_json or oidv6_csv, this is a file (not implemented yet). When output_annotation_format is yolo_textfiles, this is a folder. Default: ./examples/yolo_textfiles_examples/
+        The path to the output annotations. When output_annotation_format is coco_json or oidv6_csv, this is a file (oidv6_csv not implemented yet). With a test split, coco_json outputs are written to <name>_train.json and <name>_val.json. When output_annotation_format is yolo_textfiles, this is a folder. Default: ./examples/yolo_textfiles_examples/
 
     output_symlink_dir: str
         The path to where you want symlinks of images to be. Only when you do input_annotation_format `all_files`
 
+    test_split_percentage: float
+        The percentage of images to split into a val set (the rest goes into a train set). Default: 0 (no split)
+
+    split_percentages: list of float
+        The percentage of images of each split, for splits other than train/val (e.g., [80, 10, 10]). Overrides test_split_percentage. Default: None
+
+    split_names: list of str
+        The name of each split of split_percentages. Default: ['train', 'val', 'test']
+
+    split_seed: int
+        The seed of the stable hash that assigns images to splits. Default: 0
+
+    stratify: bool
+        An option to split each stratum (the rarest category of each image) in the split percentages, so that rare categories are in every split. 
+        Assignments are still identical across reruns of the same inputs, but adding or removing images can move existing images to another split 
+        (and, with incremental, rewrite their textfiles). Default: False
+
+    clean: bool
+        An option to clip bboxes to their image and remove invalid, tiny, extremely elongated and duplicate bboxes after reading the inputs 
+        (see helpers/cleaning.py). Default: False
+
+    min_box_area: float
+        With clean, bboxes with an area smaller than this fraction of their image are removed. Default: 0 (only bboxes with no area)
+
+    max_aspect_ratio: float
+        With clean, bboxes that are more than this many times longer than wide (or wider than long) are removed. Default: None (no limit)
+
+    dedup_iou: float
+        With clean, bboxes that overlap an earlier bbox of the same image and category with at least this IoU are removed. Default: None (no de-duplication)
+
+    stream_coco_json: bool
+        An option to read coco_json input annotations incrementally instead of loading the whole file at once. Uses much less memory for large files. Default: False
+
+    num_workers: int
+        The number of worker processes or threads used to read oidv6_csv input annotations and write output annotations. Default: 1
+
+    parallel_backend: str
+        Whether the workers are processes or threads. Options: process, thread. Default: process
+
+    float_precision: int
+        The number of decimals of the bbox coordinates in yolo_textfiles outputs. Default: 6
+
+    skip_unchanged: bool
+        An option to not rewrite yolo_textfiles outputs that already have the right content, so that reruns are cheap. Default: False
+
+    images_dir: str
+        The folder of the images of yolo_textfiles input annotations. Default: the `images` folder next to the input annotations folder
+
+    image_sizes: str
+        The path to a sidecar file with the size of each image of yolo_textfiles input annotations, either a json file {image_filename: [width, height]} 
+        or a csv file with lines `image_filename,width,height`. Sizes are needed to write coco_json outputs.
+
+    yolo_class_names: str
+        The path to the class names file (one name per line) of yolo_textfiles input annotations. Default: classes.txt or obj.names in the input annotations folder, 
+        otherwise the class ints are indices into categories.
+
+    image_size_index: str
+        The path to the persistent index of image sizes probed from image headers (see helpers/image_probe.py). Default: None (sizes are probed on every run)
+
+    json_indent: int
+        The indentation of coco_json outputs. Default: None (compact json)
+
+    cache_dir: str
+        The folder of the on-disk cache of parsed input annotations (see helpers/annotation_cache.py). No cache is used when it is not given. 
+
+    cache_max_size_mb: int
+        The maximum size of the cache. The least recently used entries are deleted past it. Default: 10240
+
+    no_cache:
+        A boolean option to neither read nor write the cache. Default: False
+
+    cache_hash_contents: bool
+        An option to identify cached inputs by a hash of their contents instead of their size and modification time. Slower (each input is
+        read once more), but cache entries survive `touch` and files re-downloaded to the same path. Default: False
+
+    incremental: bool
+        An option to only write the yolo_textfiles outputs of images that were added or changed since the last incremental run, and delete the outputs of 
+        removed images. Uses a manifest of per-image digests in each output folder. Default: False
+
+    category_aliases: str
+        The path to a json file {source category name: category} that maps other category names of the inputs onto categories 
+        (e.g., {"puppy": "dog"}). Default: None
+
+    oid_hierarchy: str
+        The path to an OID hierarchy json file (e.g., bbox_labels_600_hierarchy.json). Every label under one of the categories in the 
+        hierarchy is rolled up into it (e.g., all the dog breeds into dog). Default: None
+
+    metrics_report: str
+        The path of a report with the wall time, CPU time, item and byte counts and peak memory of each stage of the run, and the number of bboxes 
+        of each category (see helpers/metrics.py). Written in the Prometheus text format if it ends with .prom, otherwise in json. Default: None (no report)
+
+    profile_output: str
+        The path where cProfile stats of the run (main process only) are saved. Default: None (no profiling)
+
+    pipeline: bool
+        An option to write yolo_textfiles outputs while the inputs are still being read, with num_workers writer threads fed through bounded 
+        queues (see helpers/pipeline.py). Bboxes are never all held in memory. Not compatible with coco_json outputs, stratify, clean, incremental 
+        and skip_unchanged, and images of several inputs are merged by filename. Default: False
+
+    pipeline_queue_size: int
+        With pipeline, the maximum number of parsed batches waiting for each writer thread. Default: 8
+
     count_bboxes_only:
-        A boolean option to only count the number of bboxes for each category (i.e., do not write any output annotation files, and do not symlink images when input_annotation_format is `all_files`). Default: False
+        A boolean option to only count the number of bboxes for each category (i.e., do not write any output annotation files, and do not symlink images when input_annotation_format is `all_files`). 
+        Bboxes are counted as they are read and are not kept in memory. Default: False
     """
     
     def __init__(self, config):
+        self.config = config
         self.categories = config['categories']
         self.categories = helpers.clean_list(self.categories)
         
@@ -50,166 +182,289 @@ class AnnotationConverter():
         self.output_annotation_format = config['output_annotation_format']
         self.output_annotations = config['output_annotations']
         self.test_split_percentage = config['test_split_percentage']
+        self.stream_coco_json = config.get('stream_coco_json', False)
+        self.num_workers = config.get('num_workers', 1)
+        self.parallel_backend = config.get('parallel_backend', 'process')
+        self.float_precision = config.get('float_precision', 6)
+        self.skip_unchanged = config.get('skip_unchanged', False)
+        self.incremental = config.get('incremental', False)
+        self.images_dir = config.get('images_dir')
+        self.image_sizes_file = config.get('image_sizes')
+        self.yolo_class_names_file = config.get('yolo_class_names')
+        self.json_indent = config.get('json_indent')
+        self.image_size_index_file = config.get('image_size_index')
+        self.on_filename_collision = config.get('on_filename_collision', 'rename')
+        self.split_percentages = config.get('split_percentages')
+        self.split_names = config.get('split_names', ['train', 'val', 'test'])
+        self.split_seed = config.get('split_seed', 0)
+        self.stratify = config.get('stratify', False)
+        self.clean = config.get('clean', False)
+        self.min_box_area = config.get('min_box_area', 0.0)
+        self.max_aspect_ratio = config.get('max_aspect_ratio')
+        self.dedup_iou = config.get('dedup_iou')
+        self.pipeline = config.get('pipeline', False)
+        self.pipeline_queue_size = config.get('pipeline_queue_size', 8)
+        self.count_bboxes_only = config.get('count_bboxes_only', False)
+        if self.pipeline:
+            self.stream_coco_json = True  # Otherwise the whole coco_json file is parsed before the first batch can be written
+
+        self.annotation_cache = None
+        if config.get('cache_dir') and not config.get('no_cache', False):
+            self.annotation_cache = AnnotationCache(config['cache_dir'], max_bytes=config.get('cache_max_size_mb', 10240) << 20,
+                                                    hash_contents=config.get('cache_hash_contents', False))
         
+        self.metrics_report = config.get('metrics_report')
+        self.profile_output = config.get('profile_output')
+        # Metrics are only recorded when they are reported, otherwise every stage is a no-op
+        self.metrics = MetricsRecorder(self.profile_output) if self.metrics_report or self.profile_output else NullMetricsRecorder()
+        
+        self.category_aliases_file = config.get('category_aliases')
+        self.oid_hierarchy_file = config.get('oid_hierarchy')
+        self.category_registry = CategoryRegistry(self.categories)
+        if self.category_aliases_file:
+            self.category_registry.add_aliases(read_category_aliases_file(self.category_aliases_file))
+        if self.oid_hierarchy_file:
+            self.category_registry.add_oid_hierarchy(read_oid_hierarchy_file(self.oid_hierarchy_file), self.load_oid_vocabulary())
+
         self.category_count_dict = dict()
-        self.all_annotations_dict = defaultdict(list)
+        self.annotations = AnnotationStore(self.categories)
+        # When set (see read_input_batches), the readers pass their bboxes to it instead of adding them to self.annotations
+        self._box_sink = None
+        # Input workers (see _read_input_shard) share the cache with each other, so only the main process evicts cache entries
+        self._evict_cache = True
+
+    def load_oid_vocabulary(self):
+        """Returns the OID vocabulary {category_id: category}, cached in memory and in the cache folder (when the cache is enabled)."""
+        return load_oid_vocabulary(cache_dir=self.annotation_cache.cache_dir if self.annotation_cache is not None else None)
+
+    @property
+    def all_annotations_dict(self):
+        """Dict-style view of self.annotations with format {image_filename: [{category, orig_category_id, image_filepath, x_min, x_max, y_min, y_max},],}"""
+        return AnnotationsDictView(self.annotations)
+
+
+    def _add_boxes(self, image_idx, category_idx, orig_category_idx, boxes):
+        """Adds the bboxes parsed by a reader to self.annotations, or passes them to self._box_sink."""
+        if self._box_sink is not None:
+            self._box_sink(image_idx, category_idx, boxes)
+        else:
+            self.annotations.add_boxes(image_idx, category_idx, orig_category_idx, boxes)
+
+    def _add_category_counts(self, category_counts):
+        """Adds the number of bboxes of each category of one input (indexed like self.categories) to self.category_count_dict and prints them."""
+        current_category_count_dict = {category: int(count) for category, count in zip(self.categories, category_counts) if count}
+        for category, count in current_category_count_dict.items():
+            self.category_count_dict[category] = self.category_count_dict.get(category, 0) + count  # In case we want to count the total
+        sorted_ccc_dict = dict(sorted(current_category_count_dict.items()))
+        print(sorted_ccc_dict)
 
+    def convert_coco_json_to_dict(self, annotation_file, streaming=None):
+        """Extracts bbox information from json files in the coco format (also used by LILABC datasets) and puts in self.annotations
 
-    def convert_coco_json_to_dict(self, annotation_file):
-        """Extracts bbox information from json files in the coco format (also used by LILABC datasets) and puts in self.all_annotations_dict
+        When streaming (default: self.stream_coco_json), the file is read incrementally with helpers.coco_stream.CocoJsonStreamReader 
+        instead of being loaded all at once, and annotations are filtered as they are decoded.
         """
         print(f'Using annotation file: {annotation_file}')
-        root_dir = os.path.dirname(annotation_file)
-        categories, annotations, images = helpers.get_coco_json_data(annotation_file)
-
-        category_id_to_name_dict = {cat['id']:cat['name'] for cat in categories}
-        categories_of_interest = set(self.categories)
-        current_category_count_dict = dict()
-
-        # Iterate over all annotations and add relevant ones to the default dict
-        for annotation in tqdm(annotations):
-            category_id = annotation['category_id']
-            category = category_id_to_name_dict[category_id]
-            if category in categories_of_interest:
-                current_category_count_dict[category] = current_category_count_dict.get(category, 0) + 1
-                self.category_count_dict[category] = self.category_count_dict.get(category, 0) + 1  # In case we want to count the total
-                
-                image_id = annotation['image_id']
-                image_filename = images[image_id]['file_name']
-                image_filepath = os.path.join(root_dir, 'images', image_filename)
-                
-                x_min, y_min, x_max, y_max = helpers.get_standard_bbox_coords_from_coco_bbox(annotation, images)
+        # Absolute, so that cached stores are also valid from another working directory
+        root_dir = os.path.dirname(os.path.abspath(annotation_file))
+        if streaming is None:
+            streaming = self.stream_coco_json
+
+        if streaming:
+            reader = CocoJsonStreamReader(annotation_file)
+            categories, images = reader.read_categories_and_images()
+        else:
+            categories, annotations, image_dicts = helpers.get_coco_json_data(annotation_file)
+            images = {image_id: (img['file_name'], img['width'], img['height']) for image_id, img in image_dicts.items()}
+
+        # Map the category ids of the file straight to the store's category indices (only for categories of interest)
+        category_id_to_idx = self.category_registry.source_id_map({cat['id']: cat['name'] for cat in categories})
+        annotation_chunks = reader.iter_annotation_chunks(category_ids=set(category_id_to_idx)) if streaming else [annotations]
+        category_counts = np.zeros(len(self.categories), dtype=np.int64)
+
+        progress_bar = tqdm(unit=' annotations')
+        for annotations in annotation_chunks:
+            image_idxs, category_idxs, orig_category_idxs, coco_bboxes, widths, heights = [], [], [], [], [], []
+            # Iterate over all annotations and add relevant ones to the annotation store
+            for annotation in annotations:
+                category_id = annotation['category_id']
+                category_idx = category_id_to_idx.get(category_id)
+                if category_idx is not None:
+                    image_filename, width, height = images[annotation['image_id']]
+                    image_filepath = os.path.join(root_dir, 'images', image_filename)
+                    image_idxs.append(self.annotations.add_image(image_filename, image_filepath, width, height))
+                    category_idxs.append(category_idx)
+                    orig_category_idxs.append(self.annotations.add_orig_category(category_id))
+                    coco_bboxes.append(annotation['bbox'])
+                    widths.append(width)
+                    heights.append(height)
 
-                bbox_dict = {'category': category, 'orig_category_id': category_id, 'image_filepath': image_filepath,
-                                        'x_min': float(x_min), 'y_min': float(y_min), 'x_max': float(x_max), 'y_max': float(y_max)}
-                self.all_annotations_dict[image_filename].append(bbox_dict)
-        sorted_ccc_dict = dict(sorted(current_category_count_dict.items()))
-        print(sorted_ccc_dict)
+            # Normalize all the bboxes of the chunk at once, using the size of the image of each bbox
+            boxes, __ = bbox_formats.convert_boxes(coco_bboxes, 'coco', 'xyxy', widths, heights)
+            self._add_boxes(image_idxs, category_idxs, orig_category_idxs, boxes)
+            category_counts += np.bincount(np.asarray(category_idxs, dtype=np.int64), minlength=len(self.categories))
+            progress_bar.update(len(annotations))
+        progress_bar.close()
+
+        self._add_category_counts(category_counts)
 
 
     def convert_oid_csv_to_dict(self, annotation_file):
-        """Extracts bbox information from csv files in the Open Images Dataset V6 format and puts in self.all_annotations_dict
+        """Extracts bbox information from csv files in the Open Images Dataset V6 format and puts in self.annotations
+
+        The file is split into byte ranges that are read by self.num_workers processes (see helpers/oid_csv.py). Rows are filtered
+        on their LabelName before their coordinates are parsed, and the header row and rows of other categories are skipped.
         """        
         print(f'Using annotation file: {annotation_file}')
-        root_dir = os.path.dirname(annotation_file)
+        # Absolute, so that cached stores are also valid from another working directory
+        root_dir = os.path.dirname(os.path.abspath(annotation_file))
         
-        categories_of_interest = set(self.categories)
-        category_id_to_name_dict = helpers.get_oid_category_id_to_name_dict(categories_of_interest)
-        current_category_count_dict = dict()
-
-        with open(annotation_file, 'r') as annotation_f:
-            csv_reader = csv.reader(annotation_f)
-            # Iterate over all annotations and add relevant ones to the default dict
-            for annotation in tqdm(csv_reader):
-                image_id, __, category_id, __, x_min, x_max, y_min, y_max, *tail = annotation
-                category = category_id_to_name_dict[category_id]
-                if category in categories_of_interest:
-                    current_category_count_dict[category] = current_category_count_dict.get(category, 0) + 1
-                    self.category_count_dict[category] = self.category_count_dict.get(category, 0) + 1
-
-                    image_filename = str(image_id) + '.jpg'
-                    image_filepath = os.path.join(root_dir, 'images', image_filename)
+        # The OID vocabulary is parsed once and cached (see helpers/categories.py)
+        category_id_to_idx = self.category_registry.source_id_map(self.load_oid_vocabulary())
+        category_ids = list(category_id_to_idx)
+        # Map the index of each LabelName (as returned by the chunk reader) to the store's category and original category indices
+        label_to_category_idx = np.array([category_id_to_idx[category_id] for category_id in category_ids], dtype=np.int32)
+        label_to_orig_category_idx = np.array([self.annotations.add_orig_category(category_id) for category_id in category_ids], dtype=np.int32)
+        category_counts = np.zeros(len(self.categories), dtype=np.int64)
+
+        progress_bar = tqdm(total=os.path.getsize(annotation_file), unit='B', unit_scale=True)
+        for (image_ids, label_idx, oid_bboxes), chunk_bytes in oid_csv.iter_oid_csv_chunks(annotation_file, category_ids, num_workers=self.num_workers):
+            # Intern each image once per chunk, in order of first appearance
+            unique_image_ids, first_rows, inverse = np.unique(np.array(image_ids, dtype=str), return_index=True, return_inverse=True)
+            unique_image_idxs = np.empty(len(unique_image_ids), dtype=np.int32)
+            for unique_idx in np.argsort(first_rows).tolist():
+                image_filename = str(unique_image_ids[unique_idx]) + '.jpg'
+                image_filepath = os.path.join(root_dir, 'images', image_filename)
+                unique_image_idxs[unique_idx] = self.annotations.add_image(image_filename, image_filepath)
 
-                    bbox_dict = {'category': category, 'orig_category_id': category_id,
-                                        'x_min': float(x_min), 'y_min': float(y_min), 'x_max': float(x_max), 'y_max': float(y_max), 'image_filepath': image_filepath}
-                    self.all_annotations_dict[image_filename].append(bbox_dict)
-        sorted_ccc_dict = dict(sorted(current_category_count_dict.items()))
-        print(sorted_ccc_dict)
+            category_idxs = label_to_category_idx[label_idx]
+            category_counts += np.bincount(category_idxs, minlength=len(self.categories))
+            boxes, __ = bbox_formats.convert_boxes(oid_bboxes, 'oid', 'xyxy')
+            self._add_boxes(unique_image_idxs[inverse.reshape(-1)], category_idxs, label_to_orig_category_idx[label_idx], boxes)
+            progress_bar.update(chunk_bytes)
+        progress_bar.close()
+
+        self._add_category_counts(category_counts)
 
-    def convert_yolo_textfiles_to_dict(annotation_dir):
-        pass
+    def convert_yolo_textfiles_to_dict(self, annotation_dir):
+        """Extracts bbox information from a folder of textfiles in the YOLO format and puts in self.annotations
 
-    def write_coco_json(self, output_file, annotations_dict):
+        The textfiles are read in batches by self.num_workers threads (see helpers/yolo_reader.py). Each textfile is matched to the
+        image with the same stem in self.images_dir (default: the `images` folder next to annotation_dir), and image sizes come from 
+        the self.image_sizes_file sidecar when it is given. Class ints are mapped to names with self.yolo_class_names_file (default: 
+        classes.txt or obj.names in annotation_dir, otherwise the class ints are indices into self.categories).
+        """
+        print(f'Using annotation folder: {annotation_dir}')
+        images_dir = os.path.abspath(self.images_dir or os.path.join(os.path.dirname(os.path.normpath(annotation_dir)), 'images'))
+        image_filenames = yolo_reader.scan_image_files(images_dir)
+        image_sizes = yolo_reader.read_image_sizes_file(self.image_sizes_file) if self.image_sizes_file else dict()
+
+        class_names_file = self.yolo_class_names_file
+        for filename in yolo_reader.CLASS_NAMES_FILENAMES:
+            if class_names_file is None and os.path.exists(os.path.join(annotation_dir, filename)):
+                class_names_file = os.path.join(annotation_dir, filename)
+        class_names = yolo_reader.read_class_names_file(class_names_file) if class_names_file else self.categories
+        # Map each class int to the store's category index (-1 for classes that are not of interest)
+        class_to_category_idx = self.category_registry.indices(class_names)
+        class_to_orig_category_idx = np.array([self.annotations.add_orig_category(class_int) for class_int in range(len(class_names))], dtype=np.int32)
+        category_counts = np.zeros(len(self.categories), dtype=np.int64)
+
+        label_files = yolo_reader.scan_label_files(annotation_dir)
+        progress_bar = tqdm(total=len(label_files), unit=' files')
+        for batch_label_files, box_counts, values in yolo_reader.iter_yolo_batches(label_files, num_workers=self.num_workers):
+            image_idxs = []
+            for label_file in batch_label_files:
+                image_filename_stem = os.path.splitext(os.path.basename(label_file))[0]
+                image_filename = image_filenames.get(image_filename_stem, image_filename_stem + '.jpg')
+                width, height = image_sizes.get(image_filename, (0, 0))
+                image_idxs.append(self.annotations.add_image(image_filename, os.path.join(images_dir, image_filename), width, height))
+
+            class_ints = values[:, 0].astype(np.int64)
+            known_classes = (class_ints >= 0) & (class_ints < len(class_names))
+            category_idxs = np.full(len(class_ints), -1, dtype=np.int32)
+            category_idxs[known_classes] = class_to_category_idx[class_ints[known_classes]]
+            keep = category_idxs >= 0
+
+            boxes, __ = bbox_formats.convert_boxes(values[keep, 1:], 'yolo', 'xyxy')
+            category_counts += np.bincount(category_idxs[keep], minlength=len(self.categories))
+            self._add_boxes(np.repeat(image_idxs, box_counts)[keep], category_idxs[keep], class_to_orig_category_idx[class_ints[keep]], boxes)
+            progress_bar.update(len(batch_label_files))
+        progress_bar.close()
+
+        self._add_category_counts(category_counts)
+
+    def fill_image_sizes(self, image_indices=None):
+        """Finds the width and height of the images of self.annotations whose size is not known (e.g., from oidv6_csv or yolo_textfiles inputs)
+        by reading only the header of their image files. Sizes are remembered in self.image_size_index_file, so only new or modified 
+        images are probed on later runs.
+        """
+        store = self.annotations
+        if image_indices is None:
+            image_indices = store.image_indices_with_boxes()
+        image_indices = np.asarray(image_indices, dtype=np.int64)
+        image_indices = image_indices[(store.image_widths[image_indices] == 0) | (store.image_heights[image_indices] == 0)]
+        if not len(image_indices):
+            return
+        print(f"Probing the size of {len(image_indices)} images")
+        with self.metrics.stage('fill_image_sizes') as stage:
+            image_size_index = ImageSizeIndex(self.image_size_index_file)
+            widths, heights = image_size_index.get_sizes([store.image_filepaths[image_idx] for image_idx in image_indices.tolist()],
+                                                            num_workers=max(self.num_workers, 8))
+            image_size_index.save()
+            stage.add(items=len(image_indices))
+        found = (widths > 0) & (heights > 0)
+        store.set_image_sizes(image_indices[found], widths[found], heights[found])
+        if not found.all():
+            print(f"Could not find the size of {np.count_nonzero(~found)} images")
+
+    def write_coco_json(self, output_file, image_indices=None):
+        """Writes the bboxes of self.annotations (optionally only those of the images in image_indices) to a json file in the coco format
+
+        The file is written incrementally (see helpers/coco_writer.py), in compact json unless self.json_indent is set.
+        """
         print(f"Writing coco json file {output_file}")
-        helpers.ensure_directory_exists(os.path.dirname(output_file))
-
-        json_dict = {}
-        json_dict['info'] = {'year': 2022, 'version': 1.0, 'description': 'created with dataset API', 'contributor': 'na', 'url': 'na', 'date_created': 'na'}
-        json_dict['licenses'] = [{'url':'N/A', 'id': 1, 'name': 'N/A'}]
-        json_dict['categories'] = []
-      
-
-        for idx, category in enumerate(self.categories):
-            category_dict = {'id': idx, 'name': category, 'supercategory': 'na'}
-            json_dict['categories'].add(category_dict)
-
-        json_dict['images'] = []
-        json_dict['annotations'] = []
-        for image_filename in tqdm(annotations_dict):
-            image_filename_stem = Path(image_filename).stem
-            #height 
-            #width
-            image_dict = {'id': image_filename_stem, 'license': 1, 'file_name': image_filename, 'height': height, 'width': width, 'date_captured': 'na'}
-            
-            for bbox in annotations_dict[image_filename]:
-                pass
+        helpers.ensure_directory_exists(os.path.dirname(output_file) or '.')
+        with self.metrics.stage('write_coco_json') as stage:
+            num_images, num_annotations, num_skipped_images = coco_writer.write_coco_json(self.annotations, output_file, image_indices, indent=self.json_indent)
+            stage.add(items=num_annotations, bytes_written=os.path.getsize(output_file))
+        print(f"Wrote {num_images} images and {num_annotations} annotations")
+        if num_skipped_images:
+            print(f"Skipped {num_skipped_images} images with an unknown width and height")
     
     def coco_to_coco(self, input_annotation_file, output_annotation_file):
-        print(f'Using annotation file: {input_annotation_file}')
-        root_dir = os.path.dirname(input_annotation_file)
-        categories, annotations, images = helpers.get_coco_json_data(input_annotation_file)
-
-        category_id_to_name_dict = {cat['id']:cat['name'] for cat in categories}
-        categories_of_interest = set(self.categories)
-        current_category_count_dict = dict()
-
-        json_dict = {}
-        json_dict['info'] = {'year': 2022, 'version': 1.0, 'description': 'created with dataset API', 'contributor': 'na', 'url': 'na', 'date_created': 'na'}
-        json_dict['licenses'] = [{'url':'N/A', 'id': 1, 'name': 'N/A'}]
-        json_dict['categories'] = []
-
-        for idx, category in enumerate(self.categories):
-            category_dict = {'id': idx, 'name': category, 'supercategory': 'na'}
-            json_dict['categories'].add(category_dict)
-
-        json_dict['images'] = []
-        json_dict['annotations'] = []
-        included_images = set()
-        for image_id in images:
-            image_filename = images[image_id]['file_name']
-            image_filepath = os.path.join(root_dir, 'images', image_filename)
-            if os.path.exists(image_filepath):
-                included_images.add(image_id)
-                image_dict = {'id': image_id, 'license': 1, 'file_name': image_filename, 'height': images[image_id]['height'], 'width': images[image_id]['width'], 'date_captured': 'na'}
-                json_dict['images'].append(image_dict)
-        for annotation in annotations:
-            if annotation['image_id'] in included_images: 
-                category = category_id_to_name_dict[annotation["category_id"]]
-                if category in categories_of_interest:
-                    new_category_id = self.categories.index(category)
-                    annotation_dict = {"id": annotation["id"], "image_id": annotation["image_id"], "bbox": annotation["bbox"], \
-                                    "segmentation": [0], "area": annotation["area"], "is_crowd": annotation["is_crowd"], \
-                                    "category_id": new_category_id}
-                    json_dict['annotations'].append(annotation_dict)
-
-        with open(output_annotation_file, 'w', encoding='utf-8') as f:
-            json.dump(json_dict, f, ensure_ascii=False, indent=4)
-
-
-
-    def write_yolo_textfiles(self, output_dir, annotations_dict):
+        """Converts a coco json file to a coco json file with only the bboxes of self.categories, and only the images that exist in the
+        `images` folder next to input_annotation_file. The file is read into self.annotations and written by write_coco_json, like any
+        other conversion to coco_json: images without bboxes of interest are not written, and image and annotation ids are renumbered
+        (see helpers/coco_writer.py) instead of keeping those of the input file."""
+        self.convert_coco_json_to_dict(input_annotation_file)
+        image_indices = self.annotations.image_indices_with_boxes()
+        image_filepaths = self.annotations.image_filepaths
+        image_exists = np.array([os.path.exists(image_filepaths[image_idx]) for image_idx in image_indices.tolist()], dtype=bool)
+        self.write_coco_json(output_annotation_file, image_indices[image_exists])
+
+    def write_yolo_textfiles(self, output_dir, image_indices=None):
         """Creates annotation textfiles in the format required by: https://github.com/ultralytics/yolov5/wiki/Train-Custom-Data
+
+        Writes one textfile for each image of self.annotations (optionally only for the images in image_indices). The images are spread
+        over self.num_workers workers (see helpers/yolo_writer.py), and the category of each bbox is already stored as its class int.
         """
         print(f"Writing annotation textfiles in {output_dir}")
         helpers.ensure_directory_exists(output_dir)
         ## Create the individual textfiles for each image
-        for image_filename in tqdm(annotations_dict):
-            image_filename_stem = Path(image_filename).stem    
-            suffix = '.txt'
-            output_filepath = os.path.join(output_dir, image_filename_stem + suffix)
-            with open(output_filepath, 'w') as f:
-                for bbox in annotations_dict[image_filename]:
-                    category = bbox['category']
-                    category_int = self.categories.index(category)
-                    x_min, x_max = bbox['x_min'], bbox['x_max']
-                    y_min, y_max = bbox['y_min'], bbox['y_max']
-                    x_center = (x_min + x_max) / 2
-                    y_center = (y_min + y_max) / 2
-                    bbox_width = x_max - x_min
-                    bbox_height = y_max - y_min
-                    data = [category_int, x_center, y_center, bbox_width, bbox_height]
-                    line = ' '.join(map(str,data)) + "\n"
-                    f.write(line)
+        writer_options = dict(num_workers=self.num_workers, parallel_backend=self.parallel_backend, float_precision=self.float_precision,
+                                skip_unchanged=self.skip_unchanged)
+        if self.incremental:
+            with self.metrics.stage('write_yolo_textfiles') as stage:
+                num_written, num_unchanged, num_deleted, bytes_written = yolo_writer.write_yolo_textfiles_incremental(self.annotations, output_dir, 
+                                                                                                            image_indices, **writer_options)
+                stage.add(items=num_written, bytes_written=bytes_written)
+            print(f"Wrote {num_written} added or changed textfiles, kept {num_unchanged} unchanged textfiles, deleted {num_deleted} textfiles")
+            return
+        with self.metrics.stage('write_yolo_textfiles') as stage:
+            num_written, num_skipped, bytes_written = yolo_writer.write_yolo_textfiles(self.annotations, output_dir, image_indices, **writer_options)
+            stage.add(items=num_written, bytes_written=bytes_written)
+        if num_skipped:
+            print(f"Wrote {num_written} textfiles, skipped {num_skipped} unchanged textfiles")
         
         # ## Create the dataset.yaml file
         # yaml_dict = {}
@@ -226,30 +481,216 @@ class AnnotationConverter():
         # with open(output_yaml, 'w') as yaml_f:
         #     data1 = yaml.dump(yaml_dict, yaml_f, default_flow_style=None)
 
-    def split_dictionary_train_test(self, test_size):
-        """Randomly splits an annotations_dict into separate dictionaries for training and testing.)
+    def clean_annotations(self):
+        """Clips the bboxes of self.annotations to their image and removes invalid, tiny (self.min_box_area), extremely elongated 
+        (self.max_aspect_ratio) and duplicate (self.dedup_iou) bboxes, then prints what was changed for each category.
+        Aspect ratios are measured in pixels, so the sizes of images that are not known yet are probed first (see fill_image_sizes).
+        Returns the number of removed bboxes.
         """
-        annotations_list = [(key, value) for key, value in self.all_annotations_dict.items()]
-        num = len(annotations_list)
-        random.shuffle(annotations_list)
-        
-        train_annotations_list = annotations_list[int((num+1)*test_size):]
-        test_annotations_list = annotations_list[:int((num+1)*test_size)]
-        train_annotations_dict = dict(train_annotations_list)
-        test_annotations_dict = dict(test_annotations_list)
-        return train_annotations_dict, test_annotations_dict
+        if self.max_aspect_ratio is not None:
+            self.fill_image_sizes()
+        report = cleaning.clean_annotations(self.annotations, min_box_area=self.min_box_area, max_aspect_ratio=self.max_aspect_ratio, 
+                                            dedup_iou=self.dedup_iou)
+        if report['clipped']:
+            print(f"Clipped bboxes: {report['clipped']}")
+        num_removed = 0
+        for reason, category_counts in report['removed'].items():
+            if category_counts:
+                print(f"Removed {reason} bboxes: {category_counts}")
+                num_removed += sum(category_counts.values())
+        self.category_count_dict = self.annotations.category_counts()
+        return num_removed
+
+    def get_splits(self):
+        """Returns the (name, fraction) of each split from self.split_percentages and self.split_names, or from 
+        self.test_split_percentage (a train split and a val split). Returns an empty list when nothing should be split.
+        """
+        if self.split_percentages:
+            if len(self.split_names) < len(self.split_percentages):
+                raise ValueError(f'Got {len(self.split_percentages)} split percentages but only {len(self.split_names)} split names')
+            split_fractions = splitter.normalize_split_fractions(self.split_percentages)
+            return list(zip(self.split_names, split_fractions.tolist()))
+        if self.test_split_percentage > 0:
+            test_fraction = self.test_split_percentage / 100
+            return [('train', 1 - test_fraction), ('val', test_fraction)]
+        return []
+
+    def split_images(self, split_fractions):
+        """Splits the images of self.annotations into len(split_fractions) sets. Returns one array of image indices per split.
+
+        Each image is assigned with a stable hash of its filename and self.split_seed (see helpers/splitter.py), so assignments are
+        identical across reruns and do not change when other images are added or removed. With self.stratify, images are instead
+        split per stratum (the rarest category of each image), so that every category is split in the requested fractions. Stratified
+        assignments are identical across reruns of the same inputs, but adding or removing images can move other images to another split.
+        """
+        store = self.annotations
+        image_indices = store.image_indices_with_boxes()
+        image_filenames = [store.image_filenames[image_idx] for image_idx in image_indices.tolist()]
+        if self.stratify:
+            strata = splitter.rarest_category_per_image(store, image_indices)
+            splits = splitter.assign_stratified_splits(image_filenames, strata, split_fractions, seed=self.split_seed)
+        else:
+            splits = splitter.assign_splits(image_filenames, split_fractions, seed=self.split_seed)
+        return [image_indices[splits == split_idx] for split_idx in range(len(split_fractions))]
+
+    def read_input_file(self, input_annotations):
+        """Parses one input (a file, or a folder for yolo_textfiles) into self.annotations. When self.annotation_cache is enabled, 
+        a previously parsed copy of the same input (and categories) is loaded instead, and new parses are saved to it.
+        """
+        cache_key = None
+        # Folders (yolo_textfiles) are not cached, because their modification time does not change when a file in them is edited
+        if self.annotation_cache is not None and self._box_sink is None and os.path.isfile(input_annotations):
+            with self.metrics.stage('load_cache') as stage:
+                cache_key = self.annotation_cache.key(input_annotations, self.input_annotation_format, self.categories,
+                                                    category_aliases=sorted(self.category_registry.aliases.items()))
+                store = self.annotation_cache.load(cache_key)
+                if store is not None:
+                    stage.add(items=len(store))
+            if store is not None:
+                print(f'Using cached annotations for: {input_annotations}')
+                self.annotations = store
+                self.category_count_dict = store.category_counts()
+                print(dict(sorted(self.category_count_dict.items())))
+                return
+
+        num_boxes = sum(self.category_count_dict.values())
+        with self.metrics.stage(f'parse_{self.input_annotation_format}') as stage:
+            if self.input_annotation_format == 'coco_json':
+                self.convert_coco_json_to_dict(input_annotations)
+            elif self.input_annotation_format == 'oidv6_csv':
+                self.convert_oid_csv_to_dict(input_annotations)
+            elif self.input_annotation_format == 'yolo_textfiles':
+                self.convert_yolo_textfiles_to_dict(input_annotations)
+            # Bytes of yolo_textfiles folders are not counted, it would take a stat per file
+            stage.add(items=sum(self.category_count_dict.values()) - num_boxes, bytes_read=os.path.getsize(input_annotations) if os.path.isfile(input_annotations) else 0)
+
+        if cache_key is not None:
+            with self.metrics.stage('save_cache'):
+                self.annotation_cache.save(cache_key, self.annotations, evict=self._evict_cache)
+
+    def read_input_annotations(self):
+        """Parses all the inputs of self.input_annotations (paths or glob patterns) into self.annotations.
+
+        With several inputs, each one is parsed in its own worker process. Workers save their AnnotationStore as .npy files in a temporary 
+        folder and the main process memory-maps them while merging, so parsed bboxes are never pickled between processes.
+        Images with the same filename but a different filepath are handled according to self.on_filename_collision.
+        """
+        input_files = helpers.expand_input_paths(self.input_annotations)
+        if len(input_files) == 1:
+            self.read_input_file(input_files[0])
+            return
+
+        print(f'Parsing {len(input_files)} inputs')
+        num_workers = max(1, min(self.num_workers, len(input_files)))
+        # Leave the remaining cores to the readers that are parallel themselves (e.g., oidv6_csv)
+        shard_config = dict(self.config, num_workers=max(1, self.num_workers // num_workers))
+        with tempfile.TemporaryDirectory(prefix='bbox-converter-shards-') as shards_dir:
+            shard_dirs = [os.path.join(shards_dir, str(shard_idx)) for shard_idx in range(len(input_files))]
+            if num_workers > 1:
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    shard_results = list(executor.map(_read_input_shard, [shard_config] * len(input_files), input_files, shard_dirs))
+            else:
+                shard_results = [_read_input_shard(shard_config, input_file, shard_dir) for input_file, shard_dir in zip(input_files, shard_dirs)]
+
+            for input_file, (shard_dir, shard_category_count_dict) in zip(input_files, shard_results):
+                shard_store = AnnotationStore.load(shard_dir, mmap_mode='r')
+                collision_prefix = os.path.splitext(os.path.basename(os.path.normpath(input_file)))[0] + '_'
+                self.annotations.extend(shard_store, self.on_filename_collision, collision_prefix)
+                for category, count in shard_category_count_dict.items():
+                    self.category_count_dict[category] = self.category_count_dict.get(category, 0) + count
+            self.annotations.boxes  # Merge the bboxes before the memory-mapped shard files are deleted
+        if self.annotation_cache is not None:
+            # The entries of the inputs were just used, so they are the last ones to be evicted
+            self.annotation_cache.evict()
+        print(dict(sorted(self.category_count_dict.items())))
+
+    def read_input_batches(self, box_sink):
+        """Parses all the inputs of self.input_annotations one after the other, passing the bboxes of each parsed batch to 
+        box_sink(image_idx, category_idx, boxes) instead of keeping them in self.annotations (which only interns the images).
+        The annotation cache is not used.
+        """
+        input_files = helpers.expand_input_paths(self.input_annotations)
+        self._box_sink = box_sink
+        try:
+            for input_file in input_files:
+                self.read_input_file(input_file)
+        finally:
+            self._box_sink = None
+        if len(input_files) > 1:
+            print(dict(sorted(self.category_count_dict.items())))
+
+    def run_pipelined(self):
+        """Reads the inputs and writes yolo_textfiles outputs at the same time (see helpers/pipeline.py), so that the run takes about 
+        as long as the slowest of the two instead of their sum.
+        """
+        if self.output_annotation_format != 'yolo_textfiles':
+            raise ValueError('pipeline only supports yolo_textfiles outputs')
+        unsupported_options = [option for option in ('stratify', 'clean', 'incremental', 'skip_unchanged') if getattr(self, option)]
+        if unsupported_options:
+            raise ValueError(f'pipeline does not support: {unsupported_options}')
+        if len(helpers.expand_input_paths(self.input_annotations)) > 1 and self.on_filename_collision != 'merge':
+            raise ValueError('pipeline merges the images of several inputs by filename, use on_filename_collision merge')
+
+        splits = self.get_splits()
+        output_dirs = [os.path.join(self.output_annotations, split_name) for split_name, __ in splits] or [self.output_annotations]
+        for output_dir in output_dirs:
+            helpers.ensure_directory_exists(output_dir)
+        print(f"Writing annotation textfiles in {', '.join(output_dirs)} while reading the inputs")
+        writer = YoloPipelineWriter(self.annotations, output_dirs, [split_fraction for __, split_fraction in splits] or None, self.split_seed,
+                                    num_writers=self.num_workers, max_queued_batches=self.pipeline_queue_size, float_precision=self.float_precision)
+        with self.metrics.stage('pipeline') as stage:
+            with writer:
+                self.read_input_batches(writer.put)
+            num_written, num_boxes, bytes_written = writer.totals()
+            stage.add(items=num_boxes, bytes_written=bytes_written)
+        print(f"Wrote {num_written} textfiles with {num_boxes} bboxes")
 
     def run(self):
+        with self.metrics.profile():
+            self._run()
+        if self.metrics_report:
+            self.metrics.set_category_counts(self.category_count_dict)
+            self.metrics.write_report(self.metrics_report)
+            print(f"Wrote metrics report {self.metrics_report}")
+        if self.profile_output:
+            print(f"Wrote profile {self.profile_output}")
+
+    def _run(self):
         print(f"\nThe list of categories used (in the order of index class labels) is:\n{self.categories}\n")
-        if self.input_annotation_format == 'coco_json':
-            self.convert_coco_json_to_dict(self.input_annotations)
-        elif self.input_annotation_format == 'oid_csv':
-            self.convert_oid_csv_to_dict(self.input_annotations)
+        if self.count_bboxes_only:
+            with self.metrics.stage('read_input') as stage:
+                self.read_input_batches(lambda image_idx, category_idx, boxes: None)
+                stage.add(items=sum(self.category_count_dict.values()))
+            return
+        if self.pipeline:
+            self.run_pipelined()
+            return
+
+        with self.metrics.stage('read_input') as stage:
+            self.read_input_annotations()
+            stage.add(items=len(self.annotations))
+        if self.clean:
+            with self.metrics.stage('clean') as stage:
+                stage.add(items=self.clean_annotations())
+
+        splits = self.get_splits()
+        with self.metrics.stage('split_images') as stage:
+            split_image_indices = self.split_images([split_fraction for __, split_fraction in splits]) if splits else []
+            stage.add(items=sum(len(image_indices) for image_indices in split_image_indices))
+        if splits:
+            print(', '.join(f'{split_name}: {len(image_indices)} images' for (split_name, __), image_indices in zip(splits, split_image_indices)))
 
         if self.output_annotation_format == 'yolo_textfiles':
-            if self.test_split_percentage > 0:
-                train_annotations_dict, test_annotations_dict = self.split_dictionary_train_test(self.test_split_percentage)
-                self.write_yolo_textfiles(os.path.join(self.output_annotations, 'train'), train_annotations_dict)
-                self.write_yolo_textfiles(os.path.join(self.output_annotations, 'val'), test_annotations_dict)
+            if splits:
+                for (split_name, __), image_indices in zip(splits, split_image_indices):
+                    self.write_yolo_textfiles(os.path.join(self.output_annotations, split_name), image_indices)
+            else:
+                self.write_yolo_textfiles(self.output_annotations)
+        elif self.output_annotation_format == 'coco_json':
+            self.fill_image_sizes()
+            if splits:
+                output_stem, output_extension = os.path.splitext(self.output_annotations)
+                for (split_name, __), image_indices in zip(splits, split_image_indices):
+                    self.write_coco_json(f'{output_stem}_{split_name}{output_extension or ".json"}', image_indices)
             else:
-                self.write_yolo_textfiles(self.output_annotations, self.all_annotations_dict)
\ No newline at end of file
+                self.write_coco_json(self.output_annotations)
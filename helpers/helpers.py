@@ -1,4 +1,5 @@
 import os
+import glob
 import json
 import pathlib
 import helpers.constants as c
@@ -26,6 +27,18 @@ def clean_list(lst):
     return lst
 
 
+def expand_input_paths(input_paths):
+    """Expands a path, a glob pattern, or a list of them into a list of paths without duplicates (the matches of each pattern are sorted).
+    Patterns that match nothing are kept as they are, so that opening them gives a clear error."""
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    expanded_paths = []
+    for input_path in input_paths:
+        matches = sorted(glob.glob(input_path)) if glob.has_magic(input_path) else []
+        expanded_paths.extend(matches or [input_path])
+    return list(dict.fromkeys(expanded_paths))
+
+
 def get_coco_json_data(json_file):
     """Opens json file that contains annotations in the COCO format,
     returns dictionaries for the three sections of interest: categories, annotations, and images
@@ -97,12 +110,7 @@ def get_oid_category_id_to_name_dict(categories_of_interest, categories_file=c.O
     categories_dict: dict
         A dict with key:value = category_id:category
     """
-    category_id_to_name_dict = dict()
-    with open(categories_file, 'r') as f:
-        for line in f:
-            category_id, category = line.split(',')
-            category = standardize_string(category)
-            if category in categories_of_interest:
-                category_id_to_name_dict[category_id] = category
-
-    return category_id_to_name_dict
+    # The file is only parsed once per process. Imported here because helpers.categories itself imports this module
+    from helpers.categories import load_oid_vocabulary
+    vocabulary = load_oid_vocabulary(categories_file)
+    return {category_id: category for category_id, category in vocabulary.items() if category in categories_of_interest}
@@ -0,0 +1,145 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers, the segments that hold the image size (0xC4, 0xC8 and 0xCC are other segments)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _probe_jpeg_size(f):
+    """Walks the JPEG segments from the start of the file until a start-of-frame segment, seeking over all other segments
+    (e.g., EXIF data and thumbnails) without reading them."""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':  # Markers can be padded with extra 0xFF bytes
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # Markers without a length
+            continue
+        if marker == 0xD9:  # End of image
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _probe_webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8 ' and len(header) >= 30:
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(header) >= 25:
+        b0, b1, b2, b3 = header[21:25]
+        return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+    if chunk == b'VP8X' and len(header) >= 30:
+        return 1 + int.from_bytes(header[24:27], 'little'), 1 + int.from_bytes(header[27:30], 'little')
+    return None
+
+
+def probe_image_size(image_filepath):
+    """Returns (width, height) of a JPEG, PNG or WebP image by reading only its header, or None if the size cannot be found."""
+    try:
+        with open(image_filepath, 'rb') as f:
+            header = f.read(32)
+            if header.startswith(PNG_SIGNATURE) and header[12:16] == b'IHDR':
+                return struct.unpack('>II', header[16:24])
+            if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+                return _probe_webp_size(header)
+            if header.startswith(b'\xff\xd8'):
+                return _probe_jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+class ImageSizeIndex():
+    """
+    Persistent index of image sizes, so that each image header is probed only once.
+
+    Entries are keyed by image path and are only used while the modification time and size of the image file stay the
+    same. The index is a tab-separated text file with lines `path  mtime_ns  file_size  width  height`.
+
+    Attributes
+    ----------
+
+    index_file: str
+        The path to the index file. When None, the index only lives in memory.
+    """
+
+    def __init__(self, index_file=None):
+        self.index_file = index_file
+        self.entries = dict()
+        self._modified = False
+        if index_file and os.path.exists(index_file):
+            with open(index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) == 5:
+                        self.entries[fields[0]] = tuple(int(field) for field in fields[1:])
+
+    def _lookup(self, image_filepath):
+        """Returns (file_stat_key, size) where size is the indexed (width, height) or None when the image must be probed."""
+        try:
+            stat = os.stat(image_filepath)
+        except OSError:
+            return None, None
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(image_filepath)
+        if entry is not None and entry[:2] == stat_key:
+            return stat_key, entry[2:]
+        return stat_key, None
+
+    def _lookup_and_probe(self, image_filepath):
+        stat_key, size = self._lookup(image_filepath)
+        if stat_key is None or size is not None:
+            return stat_key, size, False
+        return stat_key, probe_image_size(image_filepath), True
+
+    def get_sizes(self, image_filepaths, num_workers=8):
+        """Returns the widths and heights (np.ndarray of int32, 0 when unknown) of images, probing those that are not indexed yet
+        with a thread pool (probes are small reads, so threads keep many of them in flight)."""
+        image_filepaths = [str(image_filepath) for image_filepath in image_filepaths]
+        if num_workers > 1 and len(image_filepaths) > 1:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                results = list(executor.map(self._lookup_and_probe, image_filepaths))
+        else:
+            results = [self._lookup_and_probe(image_filepath) for image_filepath in image_filepaths]
+
+        widths = np.zeros(len(image_filepaths), dtype=np.int32)
+        heights = np.zeros(len(image_filepaths), dtype=np.int32)
+        for idx, (image_filepath, (stat_key, size, probed)) in enumerate(zip(image_filepaths, results)):
+            if size is None:
+                continue
+            widths[idx], heights[idx] = size
+            if probed:
+                self.entries[image_filepath] = (*stat_key, *size)
+                self._modified = True
+        return widths, heights
+
+    def save(self):
+        """Writes the index file (if anything was probed since it was loaded)."""
+        if not self.index_file or not self._modified:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+        tmp_file = f'{self.index_file}.tmp{os.getpid()}'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for image_filepath, entry in self.entries.items():
+                f.write(image_filepath + '\t' + '\t'.join(str(value) for value in entry) + '\n')
+        os.replace(tmp_file, self.index_file)
+        self._modified = False
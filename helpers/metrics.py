@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROMETHEUS_PREFIX = 'bbox_converter'
+# (field of a stage, name of the metric, help text) of the metrics written to Prometheus textfiles
+PROMETHEUS_STAGE_METRICS = [('wall_seconds', 'stage_wall_seconds', 'Wall time of each stage of the conversion.'),
+                            ('cpu_seconds', 'stage_cpu_seconds', 'CPU time of the main process in each stage of the conversion.'),
+                            ('items', 'stage_items', 'Number of items (bboxes, images or files) processed in each stage.'),
+                            ('bytes_read', 'stage_bytes_read', 'Number of bytes read in each stage.'),
+                            ('bytes_written', 'stage_bytes_written', 'Number of bytes written in each stage.'),
+                            ('peak_rss_bytes', 'stage_peak_rss_bytes', 'Peak resident memory of the main process during each stage.')]
+
+
+def _reset_peak_rss():
+    """Resets the peak resident memory of this process, so that it can be measured per stage (only possible on Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    """Returns the peak resident memory of this process since the last reset (or since it started), or 0 if it is not known."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _workers_peak_rss_bytes():
+    """Returns the largest peak resident memory of the worker processes that have finished, or 0 if it is not known."""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class StageMetrics():
+    """
+    Measurements of one stage of a conversion. Stages with the same name (e.g., writing each split) are added together.
+
+    Attributes
+    ----------
+
+    wall_seconds, cpu_seconds: float
+        The wall time and CPU time (of the main process) of the stage.
+
+    items, bytes_read, bytes_written: int
+        Counts that the stage adds with add().
+
+    peak_rss_bytes: int
+        The peak resident memory of the main process during the stage (on Linux; elsewhere, the peak since the process started).
+    """
+
+    def __init__(self):
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.items = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_bytes = 0
+
+    def add(self, items=0, bytes_read=0, bytes_written=0):
+        self.items += items
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def to_dict(self):
+        return {'wall_seconds': round(self.wall_seconds, 6), 'cpu_seconds': round(self.cpu_seconds, 6), 'items': self.items,
+                'bytes_read': self.bytes_read, 'bytes_written': self.bytes_written, 'peak_rss_bytes': self.peak_rss_bytes}
+
+
+class MetricsRecorder():
+    """
+    Records the metrics of each stage of a conversion, and writes them to a json or Prometheus textfile report.
+
+    Stages are coarse (reading the input, splitting, writing each output), so recording them costs nothing noticeable.
+    When metrics are not wanted, use NullMetricsRecorder, which has the same methods and does nothing.
+
+    Attributes
+    ----------
+
+    profile_output: str
+        The path where profile() saves cProfile stats of the main process (readable with pstats or snakeviz). Default: None (no profiling)
+    """
+
+    def __init__(self, profile_output=None):
+        self.profile_output = profile_output
+        self.stages = dict()
+        self.category_counts = dict()
+        self._peak_rss_stack = []
+        self._start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measures the code of a with block as the stage `name`. Yields the StageMetrics of the stage, to add item and byte counts to."""
+        stage_metrics = self.stages.setdefault(name, StageMetrics())
+        # Stages can be nested: keep the peak of the enclosing stage before resetting it
+        if self._peak_rss_stack:
+            self._peak_rss_stack[-1] = max(self._peak_rss_stack[-1], _peak_rss_bytes())
+        _reset_peak_rss()
+        self._peak_rss_stack.append(0)
+        start_time, start_cpu_time = time.perf_counter(), time.process_time()
+        try:
+            yield stage_metrics
+        finally:
+            stage_metrics.wall_seconds += time.perf_counter() - start_time
+            stage_metrics.cpu_seconds += time.process_time() - start_cpu_time
+            peak_rss_bytes = max(_peak_rss_bytes(), self._peak_rss_stack.pop())
+            stage_metrics.peak_rss_bytes = max(stage_metrics.peak_rss_bytes, peak_rss_bytes)
+            if self._peak_rss_stack:
+                self._peak_rss_stack[-1] = max(self._peak_rss_stack[-1], peak_rss_bytes)
+            _reset_peak_rss()
+
+    @contextlib.contextmanager
+    def profile(self):
+        """Profiles the code of a with block with cProfile when self.profile_output is set (worker processes are not profiled)."""
+        if not self.profile_output:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self.profile_output)
+
+    def set_category_counts(self, category_count_dict):
+        self.category_counts = dict(sorted(category_count_dict.items()))
+
+    def report(self):
+        """Returns all the metrics as a dict that can be saved as json."""
+        return {'total_wall_seconds': round(time.perf_counter() - self._start_time, 6),
+                'workers_peak_rss_bytes': _workers_peak_rss_bytes(),
+                'stages': {name: stage_metrics.to_dict() for name, stage_metrics in self.stages.items()},
+                'category_counts': self.category_counts}
+
+    def prometheus_text(self):
+        """Returns all the metrics in the Prometheus text format (e.g., for the textfile collector of node_exporter)."""
+        report = self.report()
+        lines = []
+
+        def add_metric(name, help_text, samples):
+            lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} gauge')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape_label_value(label_value)}"' for key, label_value in labels.items())
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}' + (f'{{{label_text}}}' if label_text else '') + f' {value}')
+
+        add_metric('total_wall_seconds', 'Wall time of the whole conversion.', [({}, report['total_wall_seconds'])])
+        add_metric('workers_peak_rss_bytes', 'Largest peak resident memory of the worker processes.', [({}, report['workers_peak_rss_bytes'])])
+        for field, name, help_text in PROMETHEUS_STAGE_METRICS:
+            add_metric(name, help_text, [({'stage': stage}, stage_report[field]) for stage, stage_report in report['stages'].items()])
+        add_metric('category_boxes', 'Number of bboxes of each category.', [({'category': category}, count) for category, count in report['category_counts'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, report_file):
+        """Writes the report to a Prometheus textfile if report_file ends with .prom, otherwise to a json file. The file is replaced
+        atomically, so that collectors never read a partial report."""
+        if os.path.dirname(report_file):
+            os.makedirs(os.path.dirname(report_file), exist_ok=True)
+        tmp_file = f'{report_file}.tmp{os.getpid()}'
+        with open(tmp_file, 'w') as f:
+            if report_file.endswith('.prom'):
+                f.write(self.prometheus_text())
+            else:
+                json.dump(self.report(), f, indent=2)
+        os.replace(tmp_file, report_file)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _NullStage():
+    """A stage that measures nothing. It is its own context manager, so entering a stage does not even create an object."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, items=0, bytes_read=0, bytes_written=0):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullMetricsRecorder():
+    """A MetricsRecorder that records nothing, used when metrics are disabled."""
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def profile(self):
+        return _NULL_STAGE
+
+    def set_category_counts(self, category_count_dict):
+        pass
@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def find_chunk_boundaries(csv_file, chunk_bytes):
+    """Splits a file into byte ranges of about chunk_bytes bytes that all start at the beginning of a line.
+    Returns a list of (start, end) tuples."""
+    file_size = os.path.getsize(csv_file)
+    boundaries = [0]
+    with open(csv_file, 'rb') as f:
+        position = chunk_bytes
+        while position < file_size:
+            f.seek(position)
+            f.readline()  # Move to the start of the next line
+            position = f.tell()
+            if position >= file_size:
+                break
+            boundaries.append(position)
+            position += chunk_bytes
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def read_oid_csv_chunk(csv_file, start, end, label_names):
+    """Reads the rows of a byte range of an Open Images Dataset V6 bbox csv file whose LabelName is in label_names.
+
+    Rows are filtered on their LabelName before any float is parsed, so rows of other categories (as well as the
+    header row) cost only a split.
+
+    Returns
+    --------
+
+    image_ids: list of str
+        The ImageID of each kept row.
+
+    label_idx: np.ndarray of int32
+        The index in label_names of the LabelName of each kept row.
+
+    boxes: np.ndarray of float32 with shape (num_rows, 4)
+        x_min, x_max, y_min, y_max of each kept row (the column order of the csv file).
+    """
+    label_to_idx = {label_name.encode(): idx for idx, label_name in enumerate(label_names)}
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    image_ids, label_idx, coords = [], [], []
+    for line in data.splitlines():
+        fields = line.split(b',', 3)
+        if len(fields) < 4:
+            continue
+        idx = label_to_idx.get(fields[2])
+        if idx is None:
+            continue
+        image_ids.append(fields[0])
+        label_idx.append(idx)
+        # Confidence, XMin, XMax, YMin, YMax, ...
+        coords.append(fields[3].split(b',', 5)[1:5])
+
+    boxes = np.array(coords, dtype=np.bytes_).astype(np.float32).reshape(-1, 4)
+    return [image_id.decode() for image_id in image_ids], np.array(label_idx, dtype=np.int32), boxes
+
+
+def iter_oid_csv_chunks(csv_file, label_names, num_workers=1, chunk_bytes=32 << 20):
+    """Reads an Open Images Dataset V6 bbox csv file in byte-range chunks, spread over num_workers processes.
+    Yields the result of read_oid_csv_chunk for each chunk, in file order, along with the number of bytes of the chunk."""
+    chunks = find_chunk_boundaries(csv_file, chunk_bytes)
+    if num_workers <= 1 or len(chunks) == 1:
+        for start, end in chunks:
+            yield read_oid_csv_chunk(csv_file, start, end, label_names), end - start
+        return
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = executor.map(read_oid_csv_chunk, [csv_file] * len(chunks), [start for start, __ in chunks], [end for __, end in chunks],
+                                [label_names] * len(chunks))
+        for result, (start, end) in zip(results, chunks):
+            yield result, end - start
@@ -1,4 +1,6 @@
+import os
 import argparse
+from helpers.annotation_cache import DEFAULT_CACHE_DIR
 
 def parse_arguements():
     
@@ -9,19 +11,112 @@ def parse_arguements():
     convert_parser.add_argument('--categories', nargs='+', type=str, default=['cat','dog', 'zebra', 'giraffe'], help='The categories we are interested in. Just separate them with a space.')
 
     convert_parser.add_argument('--input_annotation_format', type=str, choices=['coco_json', 'oidv6_csv', 'yolo_textfiles'], default='coco_json',
-        help='The style of the annotations that we want to convert into a different style. (yolo_textfiles not implemented yet). Default: coco_json')
+        help='The style of the annotations that we want to convert into a different style. Default: coco_json')
 
-    convert_parser.add_argument('--input_annotations', type=str, default = './data/coco_example.json',
-        help='The path to the input annotations. When input_annotation_format is coco_json or oidv6_csv, this is a file. When input_annotation_format is yolo_textfiles, this is a folder (not implemented yet). Default: ./examples/coco_example.json')
+    convert_parser.add_argument('--input_annotations', type=str, nargs='+', default = './data/coco_example.json',
+        help='The path to the input annotations. When input_annotation_format is coco_json or oidv6_csv, this is a file. When input_annotation_format is yolo_textfiles, this is a folder. Several paths or glob patterns (quoted) can be given, in which case they are parsed in parallel and merged. Default: ./examples/coco_example.json')
+
+    convert_parser.add_argument('--on_filename_collision', type=str, choices=['rename', 'merge', 'error'], default='rename',
+        help='What to do when images of different inputs have the same filename but a different filepath. rename prefixes the filename with the name of its input, merge treats them as the same image. Default: rename')
 
     convert_parser.add_argument('--output_annotation_format', type=str, choices=['coco_json', 'oidv6_csv', 'yolo_textfiles'], default='yolo_textfiles',
-        help='The style of the annotations that we want to convert the original annotations into. (coco_json and oidv6_csv not implemented yet). Default: yolo_textfiles')
+        help='The style of the annotations that we want to convert the original annotations into. (oidv6_csv not implemented yet). Default: yolo_textfiles')
 
     convert_parser.add_argument('--output_annotations', type=str, default='./data/yolo_textfiles_examples/',
-        help='The path to the output annotations. When output_annotation_format is coco_json or oidv6_csv, this is a file (not implemented yet). When output_annotation_format is yolo_textfiles, this is a folder. Default: ./examples/yolo_textfiles_examples/')
+        help='The path to the output annotations. When output_annotation_format is coco_json or oidv6_csv, this is a file (oidv6_csv not implemented yet). With a test split, coco_json outputs are written to <name>_train.json and <name>_val.json. When output_annotation_format is yolo_textfiles, this is a folder. Default: ./examples/yolo_textfiles_examples/')
+
+    convert_parser.add_argument('--test_split_percentage', type=float, default=0,
+        help='The percentage of images to split into a val set (the rest goes into a train set). Default: 0 (no split)')
+
+    convert_parser.add_argument('--split_percentages', type=float, nargs='+', default=None,
+        help='The percentage of images of each split, for splits other than train/val (e.g., 80 10 10). Overrides --test_split_percentage.')
+
+    convert_parser.add_argument('--split_names', type=str, nargs='+', default=['train', 'val', 'test'],
+        help='The name of each split of --split_percentages. Default: train val test')
+
+    convert_parser.add_argument('--split_seed', type=int, default=0,
+        help='The seed of the stable hash that assigns images to splits. The same seed always gives the same splits. Default: 0')
+
+    convert_parser.add_argument('--stratify', action='store_true',
+        help='Split each stratum (the rarest category of each image) in the split percentages, so that rare categories are in every split. Splits are identical across reruns of the same inputs, but adding or removing images can move existing images to another split (and, with --incremental, rewrite their textfiles).')
+
+    convert_parser.add_argument('--stream_coco_json', action='store_true',
+        help='Read coco_json input annotations incrementally instead of loading the whole file at once. Uses much less memory for large files.')
+
+    convert_parser.add_argument('--num_workers', type=int, default=os.cpu_count(),
+        help='The number of worker processes or threads used to read oidv6_csv input annotations and write output annotations. Default: the number of CPUs')
+
+    convert_parser.add_argument('--parallel_backend', type=str, choices=['process', 'thread'], default='process',
+        help='Whether the workers are processes or threads. Threads are enough when writing to slow (e.g., network) storage. Default: process')
+
+    convert_parser.add_argument('--float_precision', type=int, default=6,
+        help='The number of decimals of the bbox coordinates in yolo_textfiles outputs. Default: 6')
+
+    convert_parser.add_argument('--skip_unchanged', action='store_true',
+        help='Do not rewrite yolo_textfiles outputs that already have the right content, so that reruns are cheap.')
+
+    convert_parser.add_argument('--clean', action='store_true',
+        help='Clip bboxes to their image and remove invalid, tiny, extremely elongated and duplicate bboxes before writing them. Prints what was removed for each category.')
+
+    convert_parser.add_argument('--min_box_area', type=float, default=0.0,
+        help='With --clean, remove bboxes with an area smaller than this fraction of their image (e.g., 0.0001). Default: 0 (only bboxes with no area)')
+
+    convert_parser.add_argument('--max_aspect_ratio', type=float, default=None,
+        help='With --clean, remove bboxes that are more than this many times longer than wide or wider than long (e.g., 20).')
+
+    convert_parser.add_argument('--dedup_iou', type=float, default=None,
+        help='With --clean, remove bboxes that overlap an earlier bbox of the same image and category with at least this IoU (e.g., 0.9).')
+
+    convert_parser.add_argument('--pipeline', action='store_true',
+        help='Write yolo_textfiles outputs while the inputs are still being read, with --num_workers writer threads. Not compatible with coco_json outputs, --stratify, --clean, --incremental and --skip_unchanged.')
+
+    convert_parser.add_argument('--pipeline_queue_size', type=int, default=8,
+        help='With --pipeline, the maximum number of parsed batches waiting for each writer thread (bounds memory). Default: 8')
+
+    convert_parser.add_argument('--count_bboxes_only', action='store_true',
+        help='Only count the number of bboxes of each category, without writing any output.')
+
+    convert_parser.add_argument('--incremental', action='store_true',
+        help='Only write the yolo_textfiles outputs of images that were added or changed since the last incremental run, and delete the outputs of removed images (tracked with a manifest in each output folder).')
+
+    convert_parser.add_argument('--images_dir', type=str, default=None,
+        help='The folder of the images of yolo_textfiles input annotations. Default: the images folder next to the input annotations folder')
+
+    convert_parser.add_argument('--image_sizes', type=str, default=None,
+        help='A json file {image_filename: [width, height]} or csv file with lines image_filename,width,height, with the size of each image of yolo_textfiles input annotations.')
+
+    convert_parser.add_argument('--yolo_class_names', type=str, default=None,
+        help='The class names file (one name per line) of yolo_textfiles input annotations. Default: classes.txt or obj.names in the input annotations folder, otherwise the class ints are indices into categories.')
+
+    convert_parser.add_argument('--image_size_index', type=str, default=os.path.join(DEFAULT_CACHE_DIR, 'image_sizes.tsv'),
+        help=f'The index of image sizes probed from image headers (needed to write coco_json outputs from oidv6_csv or yolo_textfiles inputs), so that only new images are probed on later runs. Default: {os.path.join(DEFAULT_CACHE_DIR, "image_sizes.tsv")}')
+
+    convert_parser.add_argument('--json_indent', type=int, default=None,
+        help='The indentation of coco_json outputs. Default: compact json with no whitespace')
+
+    convert_parser.add_argument('--category_aliases', type=str, default=None,
+        help='The path to a json file {source category name: category} that maps other category names of the inputs onto --categories (e.g., {"puppy": "dog"}).')
+
+    convert_parser.add_argument('--oid_hierarchy', type=str, default=None,
+        help='The path to an OID hierarchy json file (e.g., bbox_labels_600_hierarchy.json). Every label under one of --categories is rolled up into it.')
+
+    convert_parser.add_argument('--metrics_report', type=str, default=None,
+        help='The path of a report with the wall time, CPU time, item and byte counts and peak memory of each stage, and the number of bboxes of each category. Written in the Prometheus text format if it ends with .prom (e.g., for the node_exporter textfile collector), otherwise in json.')
+
+    convert_parser.add_argument('--profile_output', type=str, default=None,
+        help='The path where cProfile stats of the run are saved (e.g., to open with snakeviz or pstats). Only the main process is profiled.')
+
+    convert_parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR,
+        help=f'The folder of the cache of parsed input annotations. Default: {DEFAULT_CACHE_DIR}')
+
+    convert_parser.add_argument('--cache_max_size_mb', type=int, default=10240,
+        help='The maximum size of the cache of parsed input annotations. The least recently used entries are deleted past it. Default: 10240')
+
+    convert_parser.add_argument('--no_cache', '--no-cache', action='store_true',
+        help='Always parse the input annotations, without reading or writing the cache.')
 
-    convert_parser.add_argument('--test_split_percentage', type=int, default=0,
-        help='The percentage of images to randomly split into a test set.')
+    convert_parser.add_argument('--cache_hash_contents', action='store_true',
+        help='Identify cached inputs by a hash of their contents instead of their size and modification time. Slower, but cache entries survive touch and files re-downloaded or re-extracted to the same path.')
 
     args = parser.parse_args()
 
@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+from pathlib import Path
+
+import numpy as np
+
+import helpers.bbox_formats as bbox_formats
+import helpers.splitter as splitter
+from helpers.yolo_writer import format_yolo_lines
+
+
+class YoloPipelineWriter():
+    """
+    Writes YOLO textfiles from batches of bboxes while the inputs are still being read.
+
+    Readers call put() with each batch of bboxes they parse. Each image is always handled by the same writer thread (picked from
+    its index), so its textfile is written in the order its bboxes were read: the first batch of an image creates the textfile
+    and later batches (e.g., the bboxes of an image that straddle two chunks of the input) are appended to it. Each writer thread
+    has a bounded queue, so put() blocks when the writers fall behind and only a few batches are ever held in memory.
+
+    Attributes
+    ----------
+
+    store: AnnotationStore
+        The store the readers intern the images in (only its image filenames are used, the bboxes come from the batches).
+
+    output_dirs: list of str
+        The folder of each split (or a single folder when there is no split). They must already exist.
+
+    split_fractions: list of float
+        The fraction of images of each split. Images are assigned with splitter.assign_split, which only needs the filename of the
+        image. Default: None (no split)
+
+    split_seed: int
+        The seed of the split assignments.
+
+    num_writers: int
+        The number of writer threads.
+
+    max_queued_batches: int
+        The maximum number of batches waiting in the queue of each writer thread.
+
+    float_precision: int
+        The number of decimals of the bbox coordinates.
+    """
+
+    def __init__(self, store, output_dirs, split_fractions=None, split_seed=0, num_writers=1, max_queued_batches=8, float_precision=6):
+        self.store = store
+        self.output_dirs = list(output_dirs)
+        self.split_fractions = split_fractions
+        self.split_seed = split_seed
+        self.num_writers = max(1, num_writers)
+        self.float_precision = float_precision
+        self._queues = [queue.Queue(maxsize=max_queued_batches) for __ in range(self.num_writers)]
+        self._totals = np.zeros((self.num_writers, 3), dtype=np.int64)
+        self._error = None
+        self._threads = [threading.Thread(target=self._write_batches, args=(writer_idx,), daemon=True) for writer_idx in range(self.num_writers)]
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop()
+        if exc_type is None and self._error is not None:
+            raise self._error
+        return False
+
+    def _stop(self):
+        for writer_queue in self._queues:
+            writer_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def put(self, image_idx, category_idx, boxes):
+        """Queues a batch of bboxes (normalized x_min, y_min, x_max, y_max) to be written. Blocks while the writer queues are full."""
+        if self._error is not None:
+            raise self._error
+        image_idx = np.asarray(image_idx, dtype=np.int64)
+        if len(image_idx) == 0:
+            return
+        category_idx = np.asarray(category_idx, dtype=np.int32)
+        # Same precision as AnnotationStore, so that the textfiles are identical to those of write_yolo_textfiles
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if self.num_writers == 1:
+            self._queues[0].put((image_idx, category_idx, boxes))
+            return
+        writer_idx = image_idx % self.num_writers
+        for idx in np.unique(writer_idx).tolist():
+            mask = writer_idx == idx
+            self._queues[idx].put((image_idx[mask], category_idx[mask], boxes[mask]))
+
+    def totals(self):
+        """Returns num_written (textfiles), num_boxes and bytes_written, once the writer threads are done."""
+        num_written, num_boxes, bytes_written = self._totals.sum(axis=0).tolist()
+        return num_written, num_boxes, bytes_written
+
+    def _textfile_path(self, image_idx):
+        image_filename = str(self.store.image_filenames[image_idx])
+        split_idx = splitter.assign_split(image_filename, self.split_fractions, self.split_seed) if self.split_fractions else 0
+        return os.path.join(self.output_dirs[split_idx], Path(image_filename).stem + '.txt')
+
+    def _write_batches(self, writer_idx):
+        writer_queue = self._queues[writer_idx]
+        started_images = set()
+        while True:
+            batch = writer_queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue  # Keep draining the queue so that readers never block on a failed writer
+            try:
+                self._write_batch(writer_idx, batch, started_images)
+            except Exception as error:
+                self._error = error
+
+    def _write_batch(self, writer_idx, batch, started_images):
+        image_idx, category_idx, boxes = batch
+        order = np.argsort(image_idx, kind='stable')
+        image_idx, category_idx = image_idx[order], category_idx[order]
+        yolo_bboxes, __ = bbox_formats.convert_boxes(boxes[order], 'xyxy', 'yolo')
+        lines = format_yolo_lines(category_idx, yolo_bboxes, self.float_precision)
+        starts = np.flatnonzero(np.r_[True, image_idx[1:] != image_idx[:-1]])
+        ends = np.r_[starts[1:], len(image_idx)]
+        totals = self._totals[writer_idx]
+        for start, end, image in zip(starts.tolist(), ends.tolist(), image_idx[starts].tolist()):
+            text = ''.join(lines[start:end])
+            mode = 'a' if image in started_images else 'w'
+            if mode == 'w':
+                started_images.add(image)
+                totals[0] += 1
+            with open(self._textfile_path(image), mode) as f:
+                f.write(text)
+            totals[2] += len(text)
+        totals[1] += len(image_idx)
@@ -0,0 +1,70 @@
+import hashlib
+
+import numpy as np
+
+
+def normalize_split_fractions(split_percentages):
+    """Turns split percentages (or any positive weights) into fractions that add up to 1."""
+    split_percentages = np.asarray(split_percentages, dtype=np.float64)
+    if len(split_percentages) == 0 or np.any(split_percentages < 0) or split_percentages.sum() <= 0:
+        raise ValueError(f'Invalid split percentages: {split_percentages.tolist()}')
+    return split_percentages / split_percentages.sum()
+
+
+def stable_hash_fraction(key, seed=0):
+    """Maps a key (e.g., an image filename) to a number in [0, 1) that only depends on the key and the seed,
+    unlike python's hash() which changes between runs."""
+    digest = hashlib.blake2b(f'{seed}:{key}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2**64
+
+
+def assign_split(key, split_fractions, seed=0):
+    """Returns the index of the split of one key. Only needs the key, so it can be used while streaming images, and a key
+    always gets the same split no matter which other keys exist."""
+    thresholds = np.cumsum(split_fractions)
+    return min(int(np.searchsorted(thresholds, stable_hash_fraction(key, seed), side='right')), len(split_fractions) - 1)
+
+
+def assign_splits(keys, split_fractions, seed=0):
+    """Returns the index of the split of each key (np.ndarray of int32), with the same result as assign_split for each key."""
+    fractions = np.fromiter((stable_hash_fraction(key, seed) for key in keys), dtype=np.float64)
+    thresholds = np.cumsum(split_fractions)
+    return np.minimum(np.searchsorted(thresholds, fractions, side='right'), len(split_fractions) - 1).astype(np.int32)
+
+
+def assign_stratified_splits(keys, strata, split_fractions, seed=0):
+    """Returns the index of the split of each key, so that every stratum (e.g., the rarest category of each image) is split
+    in split_fractions as closely as possible.
+
+    Within a stratum, keys are ordered by their stable hash and split by rank. Assignments are identical across reruns, but unlike
+    assign_splits, adding or removing keys can move other keys near the split boundaries of their stratum (and strata computed
+    from dataset-wide counts, like rarest_category_per_image, can change too).
+    """
+    fractions = np.fromiter((stable_hash_fraction(key, seed) for key in keys), dtype=np.float64)
+    strata = np.asarray(strata)
+    thresholds = np.cumsum(split_fractions)
+    splits = np.empty(len(fractions), dtype=np.int32)
+    # Sort by stratum, then by hash within each stratum
+    order = np.lexsort((fractions, strata))
+    sorted_strata = strata[order]
+    stratum_starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    stratum_sizes = np.diff(np.r_[stratum_starts, len(order)])
+    ranks = np.arange(len(order)) - np.repeat(stratum_starts, stratum_sizes)
+    rank_fractions = (ranks + 0.5) / np.repeat(stratum_sizes, stratum_sizes)
+    splits[order] = np.minimum(np.searchsorted(thresholds, rank_fractions, side='right'), len(split_fractions) - 1)
+    return splits
+
+
+def rarest_category_per_image(store, image_indices):
+    """Returns, for each image, the category of its bboxes that has the fewest bboxes in the whole store (used as the stratum of the image)."""
+    num_categories = max(len(store.categories), 1)
+    category_totals = np.bincount(store.category_idx, minlength=num_categories).astype(np.int64)
+    # Rank each bbox by how common its category is, with the category index as a tie-break, then take the minimum per image
+    rarity_keys = category_totals[store.category_idx] * num_categories + store.category_idx
+    image_indices = np.asarray(image_indices, dtype=np.int64)
+    rows = store.rows_for_images(image_indices)
+    box_counts = store.box_counts()[image_indices]
+    if np.any(box_counts == 0):
+        raise ValueError('Can only stratify images with at least one bbox')
+    starts = np.cumsum(box_counts) - box_counts
+    return np.minimum.reduceat(rarity_keys[rows], starts) % num_categories if len(rows) else np.empty(0, dtype=np.int64)
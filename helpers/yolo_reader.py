@@ -0,0 +1,114 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import helpers.helpers as helpers
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+CLASS_NAMES_FILENAMES = ('classes.txt', 'obj.names')
+
+
+def scan_label_files(annotation_dir):
+    """Returns the sorted paths of all the YOLO textfiles in a folder and its subfolders (using os.scandir, which avoids a stat per file)."""
+    label_files = []
+    dirs = [annotation_dir]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirs.append(entry.path)
+                elif entry.name.endswith('.txt') and entry.name not in CLASS_NAMES_FILENAMES:
+                    label_files.append(entry.path)
+    label_files.sort()
+    return label_files
+
+
+def scan_image_files(images_dir):
+    """Returns a dict {image_filename_stem: image_filename} for the images directly in a folder (empty if the folder does not exist)."""
+    image_filenames = dict()
+    if not images_dir or not os.path.isdir(images_dir):
+        return image_filenames
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            stem, extension = os.path.splitext(entry.name)
+            if extension.lower() in IMAGE_EXTENSIONS:
+                image_filenames.setdefault(stem, entry.name)
+    return image_filenames
+
+
+def read_image_sizes_file(image_sizes_file):
+    """Reads a sidecar file with the size of each image. Returns a dict {image_filename: (width, height)}.
+
+    The file is either a json file {image_filename: [width, height]} or a csv file with lines `image_filename,width,height`
+    (an optional header line is skipped).
+    """
+    image_sizes = dict()
+    with open(image_sizes_file, 'r') as f:
+        if image_sizes_file.endswith('.json'):
+            for image_filename, (width, height) in json.load(f).items():
+                image_sizes[image_filename] = (int(width), int(height))
+            return image_sizes
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) < 3 or not fields[1].strip().isdigit():
+                continue
+            image_sizes[fields[0]] = (int(fields[1]), int(fields[2]))
+    return image_sizes
+
+
+def read_class_names_file(class_names_file):
+    """Reads a YOLO class names file (one name per line, e.g. classes.txt or obj.names) and returns the standardized names."""
+    with open(class_names_file, 'r') as f:
+        return [helpers.standardize_string(line) for line in f if line.strip()]
+
+
+def _parse_yolo_text(text):
+    """Parses the contents of a YOLO textfile into a list of 5 tokens per bbox. Extra values on a line (e.g., confidences) are ignored."""
+    tokens = text.split()
+    lines = text.splitlines()
+    # Fast path: one split for the whole file when every line has exactly 5 values. A line with 4 spaces has at most 5 values,
+    # so when every line has 4 spaces and there are 5 values per line in total, no line has fewer or more
+    if len(tokens) == 5 * len(lines) and all(line.count(' ') == 4 for line in lines):
+        return tokens
+    tokens = []
+    for line in lines:
+        values = line.split()
+        if len(values) >= 5:
+            tokens.extend(values[:5])
+    return tokens
+
+
+def read_yolo_files(label_files):
+    """Reads a batch of YOLO textfiles. Numbers are parsed all at once for the whole batch.
+
+    Returns
+    --------
+
+    box_counts: list of int
+        The number of bboxes in each textfile.
+
+    values: np.ndarray of float64 with shape (num_boxes, 5)
+        class, x_center, y_center, width, height of each bbox, one textfile after the other.
+    """
+    box_counts, tokens = [], []
+    for label_file in label_files:
+        with open(label_file, 'r') as f:
+            file_tokens = _parse_yolo_text(f.read())
+        box_counts.append(len(file_tokens) // 5)
+        tokens.extend(file_tokens)
+    return box_counts, np.array(tokens, dtype=np.float64).reshape(-1, 5)
+
+
+def iter_yolo_batches(label_files, num_workers=1, files_per_batch=500):
+    """Reads YOLO textfiles in batches with a thread pool (file reads release the GIL, which matters most on network storage).
+    Yields (label_files, box_counts, values) for each batch, in order."""
+    batches = [label_files[start:start + files_per_batch] for start in range(0, len(label_files), files_per_batch)]
+    if num_workers <= 1:
+        for batch in batches:
+            yield (batch, *read_yolo_files(batch))
+        return
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for batch, result in zip(batches, executor.map(read_yolo_files, batches)):
+            yield (batch, *result)
@@ -0,0 +1,204 @@
+import os
+import json
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+import helpers.bbox_formats as bbox_formats
+
+PARALLEL_BACKENDS = ('process', 'thread')
+MANIFEST_FILENAME = '.bbox_converter_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def format_yolo_lines(category_idx, yolo_bboxes, float_precision=6):
+    """Formats bboxes as YOLO textfile lines: `class x_center y_center width height`, with a fixed number of decimals."""
+    line_format = '%d' + f' %.{float_precision}f' * 4 + '\n'
+    return [line_format % row for row in zip(np.asarray(category_idx).tolist(), *np.asarray(yolo_bboxes, dtype=np.float64).T.tolist())]
+
+
+def _file_has_content(filepath, text):
+    """Checks if a file already contains exactly text (YOLO textfiles are ascii, so the length in bytes is the length of the text)."""
+    try:
+        if os.stat(filepath).st_size != len(text):
+            return False
+        with open(filepath, 'r') as f:
+            return f.read() == text
+    except OSError:
+        return False
+
+
+def write_yolo_shard(output_dir, image_filename_stems, box_counts, category_idx, yolo_bboxes, float_precision=6, skip_unchanged=False):
+    """Writes the textfiles of a group of images. The bboxes of all the images are given one after the other, and box_counts
+    says how many of them belong to each image.
+
+    Returns
+    --------
+
+    num_written, num_skipped, bytes_written: int
+    """
+    lines = format_yolo_lines(category_idx, yolo_bboxes, float_precision)
+    num_written, num_skipped, bytes_written = 0, 0, 0
+    start = 0
+    for image_filename_stem, box_count in zip(image_filename_stems, box_counts):
+        text = ''.join(lines[start:start + box_count])
+        start += box_count
+        output_filepath = os.path.join(output_dir, image_filename_stem + '.txt')
+        if skip_unchanged and _file_has_content(output_filepath, text):
+            num_skipped += 1
+            continue
+        with open(output_filepath, 'w') as f:
+            f.write(text)
+        num_written += 1
+        bytes_written += len(text)
+    return num_written, num_skipped, bytes_written
+
+
+def write_yolo_textfiles(store, output_dir, image_indices=None, num_workers=1, parallel_backend='process',
+                            float_precision=6, skip_unchanged=False, images_per_shard=1000):
+    """Writes one YOLO textfile for each image of an AnnotationStore, spreading the images over a pool of workers.
+
+    Attributes
+    ----------
+
+    store: AnnotationStore
+        The bboxes to write. Class ints are the category_idx of the store (i.e., indices into store.categories).
+
+    output_dir: str
+        The folder where the textfiles are written. It must already exist.
+
+    image_indices: array-like of int
+        The images to write. Default: all images with at least one bbox.
+
+    num_workers: int
+        The number of worker processes or threads. With 1, everything is written in the current thread.
+
+    parallel_backend: str
+        Either `process` (formatting runs in parallel too) or `thread` (less start-up cost, enough when the file system is the bottleneck).
+
+    float_precision: int
+        The number of decimals of the bbox coordinates.
+
+    skip_unchanged: bool
+        Does not rewrite textfiles that already have the right content, so reruns mostly only read.
+
+    images_per_shard: int
+        The number of images given to a worker at a time.
+
+    Returns
+    --------
+
+    num_written, num_skipped, bytes_written: int
+    """
+    if parallel_backend not in PARALLEL_BACKENDS:
+        raise ValueError(f'Unknown parallel backend {parallel_backend}. Options: {PARALLEL_BACKENDS}')
+    if image_indices is None:
+        image_indices = store.image_indices_with_boxes()
+    image_indices = np.asarray(image_indices, dtype=np.int64)
+    box_counts = store.box_counts()
+
+    def shards():
+        for shard_start in range(0, len(image_indices), images_per_shard):
+            shard_image_indices = image_indices[shard_start:shard_start + images_per_shard]
+            rows = store.rows_for_images(shard_image_indices)
+            yolo_bboxes, __ = bbox_formats.convert_boxes(store.boxes[rows], 'xyxy', 'yolo')
+            image_filename_stems = [Path(store.image_filenames[image_idx]).stem for image_idx in shard_image_indices.tolist()]
+            yield (output_dir, image_filename_stems, box_counts[shard_image_indices].tolist(), store.category_idx[rows], yolo_bboxes,
+                    float_precision, skip_unchanged)
+
+    totals = np.zeros(3, dtype=np.int64)
+    with tqdm(total=len(image_indices), unit=' images') as progress_bar:
+        if num_workers <= 1:
+            for shard in shards():
+                totals += write_yolo_shard(*shard)
+                progress_bar.update(len(shard[1]))
+        else:
+            executor_class = ProcessPoolExecutor if parallel_backend == 'process' else ThreadPoolExecutor
+            with executor_class(max_workers=num_workers) as executor:
+                # Only keep a few shards in flight, so the formatted data of all images is never held at once
+                shard_sizes, pending = dict(), set()
+
+                def collect(futures):
+                    for future in futures:
+                        totals[:] += future.result()
+                        progress_bar.update(shard_sizes.pop(future))
+
+                for shard in shards():
+                    if len(pending) >= 2 * num_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    future = executor.submit(write_yolo_shard, *shard)
+                    shard_sizes[future] = len(shard[1])
+                    pending.add(future)
+                collect(as_completed(pending))
+    num_written, num_skipped, bytes_written = totals.tolist()
+    return num_written, num_skipped, bytes_written
+
+
+def compute_image_digests(store, image_indices):
+    """Returns a digest of the bboxes (categories and coordinates) of each image, used to find the images that changed between runs."""
+    offsets, category_idx, boxes = store.offsets, store.category_idx, store.boxes
+    digests = []
+    for image_idx in np.asarray(image_indices, dtype=np.int64).tolist():
+        start, end = offsets[image_idx], offsets[image_idx + 1]
+        image_hash = hashlib.blake2b(np.ascontiguousarray(category_idx[start:end]).tobytes(), digest_size=16)
+        image_hash.update(np.ascontiguousarray(boxes[start:end]).tobytes())
+        digests.append(image_hash.hexdigest())
+    return digests
+
+
+def load_manifest(output_dir):
+    """Returns the manifest of an output folder ({'settings': ..., 'files': {image_filename_stem: digest}}), or None if there is none."""
+    manifest_file = os.path.join(output_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def save_manifest(output_dir, settings, files):
+    manifest_file = os.path.join(output_dir, MANIFEST_FILENAME)
+    tmp_file = f'{manifest_file}.tmp{os.getpid()}'
+    with open(tmp_file, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'settings': settings, 'files': files}, f, separators=(',', ':'))
+    os.replace(tmp_file, manifest_file)
+
+
+def write_yolo_textfiles_incremental(store, output_dir, image_indices=None, float_precision=6, **kwargs):
+    """Like write_yolo_textfiles, but only writes the textfiles of images that were added or changed since the last incremental 
+    run in output_dir, and deletes the textfiles of images that are not there anymore.
+
+    A manifest with a digest of the bboxes of each image is kept in output_dir. Everything is rewritten when the categories or 
+    float_precision change. Textfiles that were edited or deleted by hand since the last run are not detected.
+
+    Returns
+    --------
+
+    num_written, num_unchanged, num_deleted, bytes_written: int
+    """
+    if image_indices is None:
+        image_indices = store.image_indices_with_boxes()
+    image_indices = np.asarray(image_indices, dtype=np.int64)
+    image_filename_stems = [Path(store.image_filenames[image_idx]).stem for image_idx in image_indices.tolist()]
+    digests = compute_image_digests(store, image_indices)
+    files = dict(zip(image_filename_stems, digests))
+
+    settings = {'categories': list(store.categories), 'float_precision': float_precision}
+    manifest = load_manifest(output_dir)
+    previous_files = manifest['files'] if manifest is not None and manifest['settings'] == settings else dict()
+
+    changed = np.array([previous_files.get(stem) != digest for stem, digest in zip(image_filename_stems, digests)], dtype=bool)
+    removed_stems = [stem for stem in previous_files if stem not in files]
+    for stem in removed_stems:
+        try:
+            os.remove(os.path.join(output_dir, stem + '.txt'))
+        except FileNotFoundError:
+            pass
+
+    num_written, __, bytes_written = write_yolo_textfiles(store, output_dir, image_indices[changed], float_precision=float_precision, **kwargs)
+    save_manifest(output_dir, settings, files)
+    return num_written, int(np.count_nonzero(~changed)), len(removed_stems), bytes_written
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from helpers.annotation_store import AnnotationStore, AnnotationsDictView
+from helpers.annotation_cache import AnnotationCache
+
+
+class TestAnnotationStore(unittest.TestCase):
+
+    def test_rows_grouped_by_image(self):
+        store = AnnotationStore(['cat', 'dog'])
+        a = store.add_image('a.jpg', 'images/a.jpg', 640, 480)
+        b = store.add_image('b.jpg', 'images/b.jpg')
+        store.add_boxes([b, a], [1, 0], store.add_orig_category(17), [(0.1, 0.1, 0.2, 0.2), (0.3, 0.3, 0.4, 0.4)])
+        store.add_boxes(a, 1, store.add_orig_category(18), [(0.5, 0.5, 0.6, 0.6)])
+
+        self.assertEqual(store.add_image('a.jpg', 'images/a.jpg'), a)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.box_counts().tolist(), [2, 1])
+        self.assertEqual(store.category_idx[store.image_rows(a)].tolist(), [0, 1])
+        self.assertEqual(store.category_counts(), {'cat': 1, 'dog': 2})
+        self.assertEqual(store.image_widths.tolist(), [640, 0])
+
+    def test_dict_view(self):
+        store = AnnotationStore(['cat'])
+        store.add_image('empty.jpg', 'images/empty.jpg')
+        image_idx = store.add_image('a.jpg', 'images/a.jpg')
+        store.add_boxes(image_idx, 0, store.add_orig_category('/m/01yrx'), [(0.25, 0.5, 0.75, 1.0)])
+
+        view = AnnotationsDictView(store)
+        self.assertEqual(list(view), ['a.jpg'])
+        self.assertNotIn('empty.jpg', view)
+        bbox = view['a.jpg'][0]
+        self.assertEqual(bbox['category'], 'cat')
+        self.assertEqual(bbox['orig_category_id'], '/m/01yrx')
+        self.assertTrue(np.allclose([bbox['x_min'], bbox['y_min'], bbox['x_max'], bbox['y_max']], [0.25, 0.5, 0.75, 1.0]))
+        self.assertFalse(AnnotationsDictView(store, image_indices=[0]))
+
+    def test_save_and_load(self):
+        store = AnnotationStore(['cat', 'dog'])
+        a = store.add_image('a.jpg', 'images/a.jpg', 640, 480)
+        store.add_boxes([a, a], [1, 0], store.add_orig_category('/m/0bt9lr'), [(0.1, 0.1, 0.2, 0.2), (0.3, 0.3, 0.4, 0.4)])
+        with tempfile.TemporaryDirectory() as directory:
+            store.save(directory)
+            loaded = AnnotationStore.load(directory)
+            self.assertEqual(dict(AnnotationsDictView(loaded)), dict(AnnotationsDictView(store)))
+            self.assertEqual(loaded.image_widths.tolist(), [640])
+
+            # Image filenames and filepaths are saved as UTF-8 bytes, not as fixed-width UTF-32 strings
+            self.assertEqual(list(loaded.image_filepaths), ['images/a.jpg'])
+            saved_filepaths = np.load(os.path.join(directory, 'image_filepaths.npy'))
+            self.assertEqual((saved_filepaths.dtype, len(saved_filepaths)), (np.uint8, len('images/a.jpg')))
+
+            # Loaded stores can still grow
+            b = loaded.add_image('b.jpg', 'images/b.jpg')
+            loaded.add_boxes(b, 0, 0, [(0.5, 0.5, 0.6, 0.6)])
+            self.assertEqual(loaded.get_image_index('a.jpg'), a)
+            self.assertEqual(loaded.box_counts().tolist(), [2, 1])
+
+            # Including non-ASCII filenames, and stores saved after they were loaded
+            loaded.add_image('çà_é.jpg', 'images/çà_é.jpg')
+            loaded.save(os.path.join(directory, 'resaved'))
+            self.assertEqual(list(AnnotationStore.load(os.path.join(directory, 'resaved')).image_filenames), ['a.jpg', 'b.jpg', 'çà_é.jpg'])
+
+    def test_extend_renames_collisions(self):
+        # Three inputs named train.json in different folders, each with a different image x.jpg
+        store = AnnotationStore(['cat'])
+        for input_idx in range(3):
+            other = AnnotationStore(['cat'])
+            image_idx = other.add_image('x.jpg', f's{input_idx}/images/x.jpg')
+            other.add_boxes(image_idx, 0, other.add_orig_category(1), [(0.1, 0.1, 0.2, 0.2)] * (input_idx + 1))
+            store.extend(other, 'rename', 'train_')
+        self.assertEqual(list(store.image_filenames), ['x.jpg', 'train_x.jpg', 'train_1_x.jpg'])
+        self.assertEqual(list(store.image_filepaths), ['s0/images/x.jpg', 's1/images/x.jpg', 's2/images/x.jpg'])
+        self.assertEqual(store.box_counts().tolist(), [1, 2, 3])
+
+        # Images with the same filepath are still merged
+        other = AnnotationStore(['cat'])
+        other.add_boxes(other.add_image('x.jpg', 's2/images/x.jpg'), 0, other.add_orig_category(1), [(0.3, 0.3, 0.4, 0.4)])
+        store.extend(other, 'rename', 'train_')
+        self.assertEqual(store.box_counts().tolist(), [1, 2, 4])
+
+    def test_cache_eviction(self):
+        store = AnnotationStore(['cat'])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            annotation_file = os.path.join(cache_dir, 'annotations.json')
+            with open(annotation_file, 'w') as f:
+                f.write('{}')
+            cache = AnnotationCache(os.path.join(cache_dir, 'cache'), max_bytes=1)
+            key = cache.key(annotation_file, 'coco_json', ['cat'])
+            self.assertNotEqual(key, cache.key(annotation_file, 'coco_json', ['cat', 'dog']))
+            self.assertIsNone(cache.load(key))
+            cache.save(key, store)
+            self.assertIsNotNone(cache.load(key))
+
+            # The cache is over max_bytes, so saving another entry evicts the first one
+            other_key = cache.key(annotation_file, 'coco_json', ['dog'])
+            cache.save(other_key, store)
+            self.assertIsNone(cache.load(key))
+            self.assertIsNotNone(cache.load(other_key))
+
+    def test_cache_concurrent_saves(self):
+        # Several caches on the same folder (e.g., input workers or other runs) save, load and evict at the same time
+        store = AnnotationStore(['cat'])
+        store.add_boxes(store.add_image('a.jpg', 'images/a.jpg'), 0, store.add_orig_category(1), [(0.1, 0.1, 0.2, 0.2)] * 100)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            annotation_file = os.path.join(cache_dir, 'annotations.json')
+            with open(annotation_file, 'w') as f:
+                f.write('{}')
+
+            def save_and_load(worker_idx):
+                cache = AnnotationCache(os.path.join(cache_dir, 'cache'), max_bytes=0)
+                keys = [cache.key(annotation_file, 'coco_json', [f'cat_{worker_idx}_{idx}']) for idx in range(20)]
+                for key in keys:
+                    cache.save(key, store)
+                    for other_key in keys:
+                        loaded = cache.load(other_key)
+                        if loaded is not None:
+                            self.assertEqual(len(loaded), 100)
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(save_and_load, range(8)))
+
+
+if __name__ == "__main__":
+    unittest.main()
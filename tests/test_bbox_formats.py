@@ -0,0 +1,26 @@
+import unittest
+import numpy as np
+from helpers.bbox_formats import BBOX_FORMATS, convert_boxes
+
+
+class TestBboxFormats(unittest.TestCase):
+
+    def test_round_trips(self):
+        coco_bboxes = np.array([[10, 20, 30, 40], [0, 0, 640, 480], [100, 50, 1, 2]], dtype=np.float64)
+        widths, heights = np.array([640, 640, 200]), np.array([480, 480, 100])
+        xyxy, __ = convert_boxes(coco_bboxes, 'coco', 'xyxy', widths, heights)
+        self.assertTrue(np.allclose(xyxy[0], [10 / 640, 20 / 480, 40 / 640, 60 / 480]))
+        for bbox_format in BBOX_FORMATS:
+            converted, __ = convert_boxes(xyxy, 'xyxy', bbox_format, widths, heights)
+            back, __ = convert_boxes(converted, bbox_format, 'xyxy', widths, heights)
+            self.assertTrue(np.allclose(back, xyxy), bbox_format)
+
+    def test_clip_and_drop_degenerate(self):
+        yolo_bboxes = [[0.5, 0.5, 1.2, 0.2], [0.1, 0.1, 0.0, 0.2], [1.5, 0.5, 0.2, 0.2]]
+        coco_bboxes, keep = convert_boxes(yolo_bboxes, 'yolo', 'coco', [100, 200, 300], 100, clip=True, drop_degenerate=True)
+        self.assertEqual(keep.tolist(), [True, False, False])
+        self.assertTrue(np.allclose(coco_bboxes, [[0, 40, 100, 20]]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import multiprocessing
+import unittest
+import numpy as np
+import benchmarks.synthetic as synthetic
+import benchmarks.run_benchmarks as run_benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_synthetic_datasets_agree(self):
+        label_ids, category_names = synthetic.synthetic_categories(5)
+        data = synthetic.make_synthetic_boxes(300, boxes_per_image=4, num_categories=5, seed=1)
+        args = run_benchmarks.parse_arguments(['--num_boxes', '300', '--boxes_per_image', '4', '--num_categories', '5', '--seed', '1'])
+        expected_counts = {name: int(count) for name, count in zip(category_names, np.bincount(data['category_idx'], minlength=5)) if count}
+        with tempfile.TemporaryDirectory() as data_dir:
+            for input_annotation_format in run_benchmarks.INPUT_FORMATS:
+                input_path = run_benchmarks.generate_dataset(input_annotation_format, data_dir, args)
+                ac = run_benchmarks.make_converter(input_annotation_format, input_path, category_names, 1, image_sizes=os.path.join(input_path, 'image_sizes.json'))
+                ac.read_input_file(os.path.join(input_path, 'labels') if input_annotation_format == 'yolo_textfiles' else input_path)
+                self.assertEqual(ac.category_count_dict, expected_counts)
+                self.assertEqual(len(ac.annotations), 300)
+                np.testing.assert_allclose(np.sort(ac.annotations.boxes, axis=0), np.sort(data['boxes'], axis=0), atol=2e-3)
+
+    def test_compare_to_baseline(self):
+        baseline = {'results': {'coco_json': {'a': {'seconds': 1.0}, 'b': {'seconds': 0.01}}}}
+        run = {'results': {'coco_json': {'a': {'seconds': 1.5}, 'b': {'seconds': 0.03}, 'c': {'seconds': 1.0}}}}
+        rows = run_benchmarks.compare_to_baseline(run, baseline, tolerance=0.2)
+        self.assertEqual([(row[1], row[-1]) for row in rows], [('a', True), ('b', False)])
+
+    def test_failed_benchmark_process(self):
+        args = run_benchmarks.parse_arguments(['--num_boxes', '10'])
+        with tempfile.TemporaryDirectory() as output_dir:
+            # A stage that raises in the child process is raised in the parent instead of blocking it
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_benchmarks._benchmark_format_process,
+                                                args=(queue, 'coco_json', os.path.join(output_dir, 'missing.json'), output_dir, args))
+            process.start()
+            with self.assertRaisesRegex(RuntimeError, 'FileNotFoundError'):
+                run_benchmarks._get_process_results(queue, process, poll_seconds=0.1)
+
+            # So is a child process that dies without results
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=os._exit, args=(3,))
+            process.start()
+            with self.assertRaisesRegex(RuntimeError, 'code 3'):
+                run_benchmarks._get_process_results(queue, process, poll_seconds=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
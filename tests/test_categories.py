@@ -0,0 +1,63 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+import helpers.categories as categories
+from helpers.categories import CategoryRegistry
+from helpers.converter import AnnotationConverter
+
+
+class TestCategories(unittest.TestCase):
+
+    def test_registry(self):
+        registry = CategoryRegistry(['cat', 'dog'], aliases={'Puppy': 'dog', 'dog': 'cat'})
+        self.assertEqual(registry.index('puppy'), 1)
+        self.assertEqual(registry.index('dog'), 1)  # Categories keep their own index
+        self.assertEqual(registry.index('zebra'), -1)
+        np.testing.assert_array_equal(registry.indices(['zebra', 'cat', 'puppy']), [-1, 0, 1])
+        self.assertEqual(registry.source_id_map({1: 'cat', 2: 'zebra', 3: 'puppy'}), {1: 0, 3: 1})
+        with self.assertRaises(ValueError):
+            registry.add_aliases({'kitten': 'lion'})
+
+    def test_oid_hierarchy(self):
+        vocabulary = {'/m/a': 'animal', '/m/d': 'dog', '/m/b': 'beagle', '/m/c': 'cat'}
+        hierarchy = {'LabelName': '/m/root', 'Subcategory': [
+                        {'LabelName': '/m/a', 'Subcategory': [
+                            {'LabelName': '/m/d', 'Subcategory': [{'LabelName': '/m/b'}]},
+                            {'LabelName': '/m/c'}]}]}
+        registry = CategoryRegistry(['animal', 'dog'])
+        registry.add_oid_hierarchy(hierarchy, vocabulary)
+        self.assertEqual(registry.aliases, {'beagle': 'dog', 'cat': 'animal'})
+        self.assertEqual(registry.source_id_map(vocabulary), {'/m/a': 0, '/m/d': 1, '/m/b': 1, '/m/c': 0})
+
+    def test_load_oid_vocabulary(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            vocabulary = categories.load_oid_vocabulary(cache_dir=cache_dir)
+            self.assertEqual(vocabulary['/m/011k07'], 'tortoise')
+            self.assertIs(categories.load_oid_vocabulary(cache_dir=cache_dir), vocabulary)
+            cache_files = os.listdir(os.path.join(cache_dir, 'vocabularies'))
+            self.assertEqual(len(cache_files), 1)
+            with open(os.path.join(cache_dir, 'vocabularies', cache_files[0])) as f:
+                self.assertEqual(json.load(f), dict(vocabulary))
+
+    def test_converter_category_aliases(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            aliases_file = os.path.join(input_dir, 'aliases.json')
+            with open(aliases_file, 'w') as f:
+                json.dump({'zebra': 'animal', 'giraffe': 'animal'}, f)
+            config = {'categories': ['zebra', 'giraffe'], \
+                        'input_annotation_format': 'coco_json', \
+                        'input_annotations': './data/coco_ex.json', \
+                        'output_annotation_format': 0, \
+                        'output_annotations': 0,
+                        'test_split_percentage': 0}
+            ac = AnnotationConverter(config)
+            ac.convert_coco_json_to_dict(ac.input_annotations)
+            ac_aliases = AnnotationConverter(dict(config, categories=['animal'], category_aliases=aliases_file))
+            ac_aliases.convert_coco_json_to_dict(ac_aliases.input_annotations)
+        self.assertEqual(ac_aliases.category_count_dict, {'animal': sum(ac.category_count_dict.values())})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import helpers.cleaning as cleaning
+from helpers.annotation_store import AnnotationStore
+from helpers.converter import AnnotationConverter
+from tests.test_image_probe import png_bytes
+
+
+class TestCleaning(unittest.TestCase):
+
+    def test_clean_annotations(self):
+        store = AnnotationStore(['cat', 'dog'])
+        image_idx = store.add_image('a.jpg', 'a.jpg', 200, 100)
+        store.add_boxes(image_idx, [0, 0, 1, 0, 0, 0, 0, 1], 0, [[-0.1, 0.1, 0.5, 0.5],     # Clipped
+                                                                [0.2, 0.2, 0.2, 0.6],       # No area
+                                                                [0.1, 0.1, 0.105, 0.105],   # Too small
+                                                                [0.0, 0.0, 1.0, 0.02],      # 100 times wider than long in pixels
+                                                                [0.0, 0.1, 0.5, 0.5],       # Duplicate of the clipped bbox
+                                                                [0.01, 0.1, 0.5, 0.5],      # Duplicate of the clipped bbox too
+                                                                [0.6, 0.6, 0.9, 0.9],
+                                                                [0.6, 0.6, 0.9, 0.9]])      # Same bbox but another category
+        report = cleaning.clean_annotations(store, min_box_area=0.001, max_aspect_ratio=20, dedup_iou=0.9)
+        self.assertEqual(report['clipped'], {'cat': 1})
+        self.assertEqual(report['removed'], {'degenerate': {'cat': 1}, 'too_small': {'dog': 1}, 'extreme_aspect_ratio': {'cat': 1},
+                                                'duplicate': {'cat': 2}})
+        np.testing.assert_allclose(store.boxes, [[0, 0.1, 0.5, 0.5], [0.6, 0.6, 0.9, 0.9], [0.6, 0.6, 0.9, 0.9]])
+        self.assertEqual(store.category_idx.tolist(), [0, 0, 1])
+        self.assertEqual(store.box_counts().tolist(), [3])
+
+    def test_aspect_ratio_of_probed_images(self):
+        # A square bbox in normalized coordinates is 1.78 times wider than long on a 1920x1080 image without a known size
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            os.makedirs(os.path.join(dataset_dir, 'labels'))
+            os.makedirs(os.path.join(dataset_dir, 'images'))
+            with open(os.path.join(dataset_dir, 'images', 'a.png'), 'wb') as f:
+                f.write(png_bytes(1920, 1080))
+            with open(os.path.join(dataset_dir, 'labels', 'a.txt'), 'w') as f:
+                f.write('0 0.5 0.5 0.2 0.2\n')
+            config = {'categories': ['cat'], 'input_annotation_format': 'yolo_textfiles', 'input_annotations': os.path.join(dataset_dir, 'labels'),
+                        'output_annotation_format': 0, 'output_annotations': 0, 'test_split_percentage': 0, 'max_aspect_ratio': 1.5}
+            ac = AnnotationConverter(config)
+            ac.read_input_annotations()
+            self.assertEqual(ac.clean_annotations(), 1)
+            self.assertEqual(ac.annotations.image_widths.tolist(), [1920])
+
+    def test_duplicate_mask_is_greedy(self):
+        rng = np.random.default_rng(0)
+        corners = rng.uniform(0, 0.5, size=(300, 2))
+        boxes = np.hstack([corners, corners + rng.uniform(0.3, 0.5, size=(300, 2))])
+        group_keys = rng.integers(0, 4, 300)
+        removed = cleaning.duplicate_mask(boxes, group_keys, 0.6, pairs_per_batch=1000)
+        # Greedy reference: a bbox is removed when it overlaps an earlier kept bbox of its group
+        expected = np.zeros(300, dtype=bool)
+        for row in range(300):
+            earlier = np.flatnonzero((group_keys[:row] == group_keys[row]) & ~expected[:row])
+            ious = cleaning.pairwise_iou(boxes[earlier], np.repeat(boxes[row:row + 1], len(earlier), axis=0))
+            expected[row] = np.any(ious >= 0.6)
+        self.assertTrue(expected.any())
+        np.testing.assert_array_equal(removed, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
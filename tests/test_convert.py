@@ -1,7 +1,20 @@
+import os
+import json
+import shutil
 import sys
+import tempfile
 #sys.path.insert(0, '..')
 import unittest
+import numpy as np
+import helpers.helpers as helpers
+import helpers.yolo_writer as yolo_writer
+import helpers.yolo_reader as yolo_reader
+import helpers.oid_csv as oid_csv
+import helpers.coco_writer as coco_writer
+import helpers.pipeline as pipeline_module
 from helpers.converter import AnnotationConverter
+from helpers.coco_stream import CocoJsonStreamReader
+from helpers.annotation_store import AnnotationStore
 
 
 class TestConvert(unittest.TestCase):
@@ -30,6 +43,305 @@ class TestConvert(unittest.TestCase):
         all_annotations_dict = ac.all_annotations_dict  # Should be an empty defaultdict, which evaluates to False. 
         self.assertFalse(all_annotations_dict)
 
+    def test_coco_json_stream_matches_eager(self):
+        for annotation_file in ['./data/coco_ex.json', './data/ena24.json']:
+            config = {'categories': ['zebra', 'giraffe', 'bear', 'Wild Turkey'], \
+                        'input_annotation_format': 'coco_json', \
+                        'input_annotations': annotation_file, \
+                        'output_annotation_format': 0, \
+                        'output_annotations': 0,
+                        'test_split_percentage': 0}
+            eager_ac = AnnotationConverter(config)
+            eager_ac.convert_coco_json_to_dict(eager_ac.input_annotations, streaming=False)
+            stream_ac = AnnotationConverter(config)
+            stream_ac.convert_coco_json_to_dict(stream_ac.input_annotations, streaming=True)
+            self.assertEqual(stream_ac.category_count_dict, eager_ac.category_count_dict)
+            self.assertEqual(dict(stream_ac.all_annotations_dict), dict(eager_ac.all_annotations_dict))
+            self.assertTrue(eager_ac.all_annotations_dict)
+
+    def test_coco_json_stream_reader_small_chunks(self):
+        categories, annotations, images = helpers.get_coco_json_data('./data/coco_ex.json')
+        reader = CocoJsonStreamReader('./data/coco_ex.json', chunk_size=5)
+        stream_categories, stream_images = reader.read_categories_and_images()
+        self.assertEqual(stream_categories, categories)
+        self.assertEqual(stream_images, {image_id: (img['file_name'], img['width'], img['height']) for image_id, img in images.items()})
+        chunks = list(reader.iter_annotation_chunks(category_ids={25}, annotations_per_chunk=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual([a for chunk in chunks for a in chunk], [a for a in annotations if a['category_id'] == 25])
+
+    def test_write_yolo_textfiles(self):
+        config = {'categories': ['zebra', 'giraffe'], \
+                    'input_annotation_format': 'coco_json', \
+                    'input_annotations': './data/coco_ex.json', \
+                    'output_annotation_format': 'yolo_textfiles', \
+                    'output_annotations': 0,
+                    'test_split_percentage': 0}
+        ac = AnnotationConverter(config)
+        ac.convert_coco_json_to_dict(ac.input_annotations)
+        with tempfile.TemporaryDirectory() as output_dir:
+            outputs = []
+            for num_workers, parallel_backend in [(1, 'process'), (2, 'thread'), (2, 'process')]:
+                ac.num_workers, ac.parallel_backend = num_workers, parallel_backend
+                ac.write_yolo_textfiles(os.path.join(output_dir, parallel_backend + str(num_workers)))
+                with open(os.path.join(output_dir, parallel_backend + str(num_workers), '000000163290.txt')) as f:
+                    outputs.append(f.read())
+            self.assertEqual(outputs[0], '1 0.270542 0.803133 0.413792 0.231391\n0 0.589823 0.625453 0.123646 0.358562\n0 0.428563 0.541250 0.081125 0.047719\n')
+            self.assertEqual(outputs[1], outputs[0])
+            self.assertEqual(outputs[2], outputs[0])
+
+            store = ac.annotations
+            self.assertEqual(yolo_writer.write_yolo_textfiles(store, os.path.join(output_dir, 'process1'), skip_unchanged=True)[:2], (0, 3))
+
+    def test_write_yolo_textfiles_incremental(self):
+        store = AnnotationStore(['zebra', 'giraffe'])
+        for image_filename, category_idx in [('a.jpg', 0), ('b.jpg', 1), ('c.jpg', 0)]:
+            image_idx = store.add_image(image_filename, image_filename)
+            store.add_boxes(image_idx, category_idx, category_idx, np.array([[0.1, 0.2, 0.5, 0.6]]))
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.assertEqual(yolo_writer.write_yolo_textfiles_incremental(store, output_dir)[:3], (3, 0, 0))
+            self.assertEqual(yolo_writer.write_yolo_textfiles_incremental(store, output_dir)[:3], (0, 3, 0))
+
+            # Change b, remove c and add d
+            new_store = AnnotationStore(['zebra', 'giraffe'])
+            for image_filename, category_idx in [('a.jpg', 0), ('b.jpg', 0), ('d.jpg', 1)]:
+                image_idx = new_store.add_image(image_filename, image_filename)
+                new_store.add_boxes(image_idx, category_idx, category_idx, np.array([[0.1, 0.2, 0.5, 0.6]]))
+            self.assertEqual(yolo_writer.write_yolo_textfiles_incremental(new_store, output_dir)[:3], (2, 1, 1))
+            self.assertEqual(sorted(f for f in os.listdir(output_dir) if f.endswith('.txt')), ['a.txt', 'b.txt', 'd.txt'])
+            with open(os.path.join(output_dir, 'b.txt')) as f:
+                self.assertEqual(f.read()[0], '0')
+
+            # A different float precision rewrites everything
+            self.assertEqual(yolo_writer.write_yolo_textfiles_incremental(new_store, output_dir, float_precision=3)[:3], (3, 0, 0))
+
+    def test_metrics_report(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            for report_filename in ['metrics.json', 'metrics.prom']:
+                config = {'categories': ['zebra', 'giraffe'], \
+                            'input_annotation_format': 'coco_json', \
+                            'input_annotations': './data/coco_ex.json', \
+                            'output_annotation_format': 'yolo_textfiles', \
+                            'output_annotations': os.path.join(output_dir, 'labels'),
+                            'test_split_percentage': 20, \
+                            'metrics_report': os.path.join(output_dir, report_filename)}
+                AnnotationConverter(config).run()
+            with open(os.path.join(output_dir, 'metrics.json')) as f:
+                report = json.load(f)
+            self.assertEqual(list(report['stages']), ['read_input', 'parse_coco_json', 'split_images', 'write_yolo_textfiles'])
+            self.assertEqual(report['stages']['read_input']['items'], sum(report['category_counts'].values()))
+            self.assertEqual(report['stages']['parse_coco_json']['bytes_read'], os.path.getsize('./data/coco_ex.json'))
+            self.assertGreater(report['stages']['write_yolo_textfiles']['bytes_written'], 0)
+            with open(os.path.join(output_dir, 'metrics.prom')) as f:
+                prometheus_text = f.read()
+            self.assertIn('bbox_converter_stage_items{stage="read_input"} %d' % report['stages']['read_input']['items'], prometheus_text)
+            self.assertIn('bbox_converter_category_boxes{category="zebra"} %d' % report['category_counts']['zebra'], prometheus_text)
+
+    def test_pipeline(self):
+        config = {'categories': ['zebra', 'giraffe'], \
+                    'input_annotation_format': 'coco_json', \
+                    'input_annotations': './data/coco_ex.json', \
+                    'output_annotation_format': 'yolo_textfiles', \
+                    'output_annotations': 0,
+                    'test_split_percentage': 30, \
+                    'num_workers': 2}
+        with tempfile.TemporaryDirectory() as output_dir:
+            outputs = []
+            for pipeline in [False, True]:
+                AnnotationConverter(dict(config, output_annotations=os.path.join(output_dir, str(pipeline)), pipeline=pipeline)).run()
+                files = dict()
+                for split_name in ['train', 'val']:
+                    for filename in os.listdir(os.path.join(output_dir, str(pipeline), split_name)):
+                        with open(os.path.join(output_dir, str(pipeline), split_name, filename)) as f:
+                            files[(split_name, filename)] = f.read()
+                outputs.append(files)
+            self.assertEqual(outputs[1], outputs[0])
+
+            # Batches of the same image are appended to its textfile
+            store = AnnotationStore(['zebra', 'giraffe'])
+            image_indices = [store.add_image(image_filename, image_filename) for image_filename in ['a.jpg', 'b.jpg']]
+            with pipeline_module.YoloPipelineWriter(store, [output_dir], num_writers=2, max_queued_batches=1) as writer:
+                writer.put([image_indices[0], image_indices[1]], [0, 1], [[0, 0, 0.5, 0.5], [0, 0, 1, 1]])
+                writer.put([image_indices[0]], [1], [[0.5, 0.5, 1, 1]])
+            self.assertEqual(writer.totals(), (2, 3, 114))
+            with open(os.path.join(output_dir, 'a.txt')) as f:
+                self.assertEqual(f.read(), '0 0.250000 0.250000 0.500000 0.500000\n1 0.750000 0.750000 0.500000 0.500000\n')
+
+        ac = AnnotationConverter(dict(config, count_bboxes_only=True))
+        ac.run()
+        self.assertEqual(len(ac.annotations), 0)
+        self.assertEqual(sum(ac.category_count_dict.values()), 7)
+
+    def test_oid_csv_to_dict(self):
+        rows = ['ImageID,Source,LabelName,Confidence,XMin,XMax,YMin,YMax,IsOccluded,IsTruncated,IsGroupOf,IsDepiction,IsInside',
+                'img1,xclick,/m/0bt9lr,1,0.1,0.5,0.2,0.6,0,0,0,0,0',
+                'img1,xclick,/m/011k07,1,0.0,1.0,0.0,1.0,0,0,0,0,0',
+                'img2,xclick,/m/01yrx,1,0.25,0.75,0.125,0.375,0,0,0,0,0',
+                'img1,xclick,/m/01yrx,1,0.3,0.4,0.3,0.4,0,0,0,0,0']
+        with tempfile.TemporaryDirectory() as input_dir:
+            annotation_file = os.path.join(input_dir, 'oidv6-train-annotations-bbox.csv')
+            with open(annotation_file, 'w') as f:
+                f.write('\n'.join(rows) + '\n')
+            self.assertEqual(len(oid_csv.find_chunk_boundaries(annotation_file, 50)), 4)
+            chunks = [chunk for chunk, __ in oid_csv.iter_oid_csv_chunks(annotation_file, ['/m/01yrx'], num_workers=2, chunk_bytes=50)]
+            self.assertEqual([chunk[0] for chunk in chunks], [[], [], ['img2'], ['img1']])
+
+            config = {'categories': ['Dog', 'cat'], \
+                        'input_annotation_format': 'oidv6_csv', \
+                        'input_annotations': annotation_file, \
+                        'output_annotation_format': 0, \
+                        'output_annotations': 0,
+                        'test_split_percentage': 0, \
+                        'num_workers': 2}
+            ac = AnnotationConverter(config)
+            ac.convert_oid_csv_to_dict(ac.input_annotations)
+        self.assertEqual(ac.category_count_dict, {'cat': 2, 'dog': 1})
+        bboxes = ac.all_annotations_dict['img1.jpg']
+        self.assertEqual([bbox['category'] for bbox in bboxes], ['dog', 'cat'])
+        self.assertEqual(bboxes[0]['orig_category_id'], '/m/0bt9lr')
+        self.assertEqual([bboxes[0][key] for key in ['x_min', 'y_min', 'x_max', 'y_max']], [np.float32(v) for v in [0.1, 0.2, 0.5, 0.6]])
+        self.assertEqual(list(ac.all_annotations_dict), ['img1.jpg', 'img2.jpg'])
+
+    def test_yolo_textfiles_round_trip(self):
+        config = {'categories': ['zebra', 'giraffe'], \
+                    'input_annotation_format': 'coco_json', \
+                    'input_annotations': './data/coco_ex.json', \
+                    'output_annotation_format': 'yolo_textfiles', \
+                    'output_annotations': 0,
+                    'test_split_percentage': 0}
+        coco_ac = AnnotationConverter(config)
+        coco_ac.convert_coco_json_to_dict(coco_ac.input_annotations)
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            labels_dir = os.path.join(dataset_dir, 'labels')
+            coco_ac.write_yolo_textfiles(labels_dir)
+            with open(os.path.join(labels_dir, 'classes.txt'), 'w') as f:
+                f.write('giraffe\nzebra\nelephant\n')
+            image_sizes_file = os.path.join(dataset_dir, 'image_sizes.csv')
+            with open(image_sizes_file, 'w') as f:
+                f.write('file_name,width,height\n000000236730.jpg,480,640\n')
+
+            config = dict(config, categories=['zebra'], input_annotation_format='yolo_textfiles', input_annotations=labels_dir, 
+                            image_sizes=image_sizes_file, num_workers=2)
+            yolo_ac = AnnotationConverter(config)
+            yolo_ac.convert_yolo_textfiles_to_dict(yolo_ac.input_annotations)
+        self.assertEqual(yolo_ac.category_count_dict, {'zebra': 4})
+        for image_filename, bboxes in yolo_ac.all_annotations_dict.items():
+            coco_bboxes = [bbox for bbox in coco_ac.all_annotations_dict[image_filename] if bbox['category'] == 'zebra']
+            for bbox, coco_bbox in zip(bboxes, coco_bboxes):
+                self.assertEqual(bbox['orig_category_id'], 1)
+                for key in ['x_min', 'y_min', 'x_max', 'y_max']:
+                    self.assertAlmostEqual(bbox[key], coco_bbox[key], places=5)
+        self.assertEqual(yolo_ac.annotations.image_widths.tolist(), [0, 0, 480])
+
+    def test_yolo_ragged_lines(self):
+        # A line with a missing value followed by a line with a confidence must not be regrouped into two bboxes
+        self.assertEqual(yolo_reader._parse_yolo_text('0 0.1 0.2 0.3\n1 0.5 0.5 0.2 0.2 0.9\n'), ['1', '0.5', '0.5', '0.2', '0.2'])
+        self.assertEqual(yolo_reader._parse_yolo_text('0\t0.1 0.2 0.3 0.4\r\n\n1 0.5 0.5 0.2 0.2'),
+                            ['0', '0.1', '0.2', '0.3', '0.4', '1', '0.5', '0.5', '0.2', '0.2'])
+
+    def test_write_coco_json(self):
+        config = {'categories': ['zebra', 'giraffe'], \
+                    'input_annotation_format': 'coco_json', \
+                    'input_annotations': './data/coco_ex.json', \
+                    'output_annotation_format': 'coco_json', \
+                    'output_annotations': 0,
+                    'test_split_percentage': 0}
+        ac = AnnotationConverter(config)
+        ac.convert_coco_json_to_dict(ac.input_annotations)
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_file = os.path.join(output_dir, 'coco.json')
+            coco_writer.write_coco_json(ac.annotations, output_file, images_per_chunk=2)
+            with open(output_file) as f:
+                data = json.load(f)
+            reread_ac = AnnotationConverter(dict(config, input_annotations=output_file))
+            reread_ac.convert_coco_json_to_dict(reread_ac.input_annotations)
+        self.assertEqual([image['id'] for image in data['images']], [1, 2, 3])
+        self.assertEqual([annotation['id'] for annotation in data['annotations']], list(range(1, 8)))
+        self.assertEqual(data['annotations'][0]['bbox'], [199.11, 225.44, 48.36, 89.1])
+        self.assertEqual(reread_ac.category_count_dict, ac.category_count_dict)
+        for image_filename, bboxes in ac.all_annotations_dict.items():
+            for bbox, reread_bbox in zip(bboxes, reread_ac.all_annotations_dict[image_filename]):
+                self.assertEqual(reread_bbox['category'], bbox['category'])
+                self.assertAlmostEqual(reread_bbox['x_min'], bbox['x_min'], places=4)
+
+        # coco_to_coco goes through the same reader and writer, and only keeps the images that exist next to the input file
+        with tempfile.TemporaryDirectory() as output_dir:
+            input_file = os.path.join(output_dir, 'coco_ex.json')
+            shutil.copy(config['input_annotations'], input_file)
+            os.makedirs(os.path.join(output_dir, 'images'))
+            for image_filename in ['000000159977.jpg', '000000236730.jpg']:
+                open(os.path.join(output_dir, 'images', image_filename), 'wb').close()
+            output_file = os.path.join(output_dir, 'coco.json')
+            AnnotationConverter(config).coco_to_coco(input_file, output_file)
+            with open(output_file) as f:
+                coco_to_coco_data = json.load(f)
+        self.assertEqual([image['file_name'] for image in coco_to_coco_data['images']], ['000000159977.jpg', '000000236730.jpg'])
+        kept_image_ids = {image['id'] for image in coco_to_coco_data['images']}
+        self.assertEqual(coco_to_coco_data['annotations'], [annotation for annotation in data['annotations'] if annotation['image_id'] in kept_image_ids])
+
+    def test_cache_from_other_working_directory(self):
+        repo_dir = os.getcwd()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            def read(input_annotations):
+                config = {'categories': ['zebra', 'giraffe'], \
+                            'input_annotation_format': 'coco_json', \
+                            'input_annotations': input_annotations, \
+                            'output_annotation_format': 0, \
+                            'output_annotations': 0,
+                            'test_split_percentage': 0, \
+                            'cache_dir': cache_dir}
+                ac = AnnotationConverter(config)
+                ac.read_input_annotations()
+                return ac
+
+            parsed = read('./data/coco_ex.json')
+            os.chdir(os.path.dirname(repo_dir))
+            try:
+                cached = read(os.path.join(os.path.basename(repo_dir), 'data', 'coco_ex.json'))
+            finally:
+                os.chdir(repo_dir)
+        # The second run is a cache hit (memory-mapped store), and its filepaths are still valid from the other working directory
+        self.assertIsInstance(cached.annotations.boxes, np.memmap)
+        self.assertEqual(list(cached.annotations.image_filepaths), list(parsed.annotations.image_filepaths))
+        self.assertEqual(cached.annotations.image_filepaths[0], os.path.join(repo_dir, 'data', 'images', cached.annotations.image_filenames[0]))
+
+    def test_cache_hash_contents(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            input_file = os.path.join(cache_dir, 'coco_ex.json')
+            shutil.copy('./data/coco_ex.json', input_file)
+            config = {'categories': ['zebra', 'giraffe'], \
+                        'input_annotation_format': 'coco_json', \
+                        'input_annotations': input_file, \
+                        'output_annotation_format': 0, \
+                        'output_annotations': 0,
+                        'test_split_percentage': 0, \
+                        'cache_dir': os.path.join(cache_dir, 'cache'), \
+                        'cache_hash_contents': True}
+            AnnotationConverter(config).read_input_annotations()
+            # A touched input is still a cache hit when inputs are identified by their contents, but not otherwise
+            os.utime(input_file, ns=(0, 0))
+            for cache_hash_contents, is_cached in [(True, True), (False, False)]:
+                ac = AnnotationConverter(dict(config, cache_hash_contents=cache_hash_contents))
+                ac.read_input_annotations()
+                self.assertEqual(isinstance(ac.annotations.boxes, np.memmap), is_cached)
+
+    def test_read_several_inputs(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            shutil.copy('./data/coco_ex.json', os.path.join(input_dir, 'coco_ex_copy.json'))
+            config = {'categories': ['zebra', 'giraffe'], \
+                        'input_annotation_format': 'coco_json', \
+                        'input_annotations': ['./data/coco_ex.json', os.path.join(input_dir, '*.json')], \
+                        'output_annotation_format': 0, \
+                        'output_annotations': 0,
+                        'test_split_percentage': 0, \
+                        'num_workers': 2}
+            ac = AnnotationConverter(config)
+            ac.read_input_annotations()
+        self.assertEqual(ac.category_count_dict, {'giraffe': 6, 'zebra': 8})
+        self.assertEqual(len(ac.annotations), 14)
+        # The copy has the same image filenames in another folder, so its images are renamed
+        self.assertEqual(len(ac.all_annotations_dict['coco_ex_copy_000000236730.jpg']), 2)
+        self.assertEqual(len(ac.all_annotations_dict['000000236730.jpg']), 2)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import os
+import struct
+import tempfile
+import unittest
+from helpers.image_probe import ImageSizeIndex, probe_image_size
+
+
+def jpeg_bytes(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + bytes(9)
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + bytes(3)
+    return b'\xff\xd8' + app0 + sof0 + b'\xff\xd9'
+
+
+def png_bytes(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', width, height) + bytes(5)
+
+
+def webp_bytes(width, height):
+    vp8x = b'VP8X' + struct.pack('<I', 10) + bytes(4) + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+    return b'RIFF' + struct.pack('<I', 4 + len(vp8x)) + b'WEBP' + vp8x
+
+
+class TestImageProbe(unittest.TestCase):
+
+    def test_probe_image_size(self):
+        with tempfile.TemporaryDirectory() as images_dir:
+            for filename, data in [('a.jpg', jpeg_bytes(640, 480)), ('b.png', png_bytes(1920, 1080)), ('c.webp', webp_bytes(300, 200)),
+                                    ('d.jpg', b'not an image')]:
+                with open(os.path.join(images_dir, filename), 'wb') as f:
+                    f.write(data)
+            self.assertEqual(probe_image_size(os.path.join(images_dir, 'a.jpg')), (640, 480))
+            self.assertEqual(probe_image_size(os.path.join(images_dir, 'b.png')), (1920, 1080))
+            self.assertEqual(probe_image_size(os.path.join(images_dir, 'c.webp')), (300, 200))
+            self.assertIsNone(probe_image_size(os.path.join(images_dir, 'd.jpg')))
+            self.assertIsNone(probe_image_size(os.path.join(images_dir, 'missing.jpg')))
+
+    def test_image_size_index(self):
+        with tempfile.TemporaryDirectory() as images_dir:
+            image_filepath = os.path.join(images_dir, 'a.png')
+            with open(image_filepath, 'wb') as f:
+                f.write(png_bytes(64, 32))
+            index_file = os.path.join(images_dir, 'index', 'image_sizes.tsv')
+            image_size_index = ImageSizeIndex(index_file)
+            widths, heights = image_size_index.get_sizes([image_filepath, os.path.join(images_dir, 'missing.png')], num_workers=2)
+            self.assertEqual((widths.tolist(), heights.tolist()), ([64, 0], [32, 0]))
+            image_size_index.save()
+
+            reloaded_index = ImageSizeIndex(index_file)
+            self.assertIn(image_filepath, reloaded_index.entries)
+            # Indexed sizes are used while the file is unchanged, and probed again after it changes
+            with open(image_filepath, 'wb') as f:
+                f.write(png_bytes(128, 96) + b'extra')
+            self.assertEqual(reloaded_index.get_sizes([image_filepath])[0].tolist(), [128])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+import helpers.splitter as splitter
+from helpers.annotation_store import AnnotationStore
+
+
+class TestSplitter(unittest.TestCase):
+
+    def test_stable_assignments(self):
+        keys = [f'{idx}.jpg' for idx in range(2000)]
+        split_fractions = splitter.normalize_split_fractions([80, 10, 10])
+        splits = splitter.assign_splits(keys, split_fractions, seed=3)
+        self.assertEqual(splits.tolist(), splitter.assign_splits(keys, split_fractions, seed=3).tolist())
+        self.assertEqual(splits[:50].tolist(), [splitter.assign_split(key, split_fractions, seed=3) for key in keys[:50]])
+        self.assertTrue(np.allclose(np.bincount(splits) / len(keys), split_fractions, atol=0.03))
+        # Adding images does not move the others
+        more_splits = splitter.assign_splits(keys + [f'new_{idx}.jpg' for idx in range(100)], split_fractions, seed=3)
+        self.assertEqual(more_splits[:len(keys)].tolist(), splits.tolist())
+        self.assertNotEqual(splitter.assign_splits(keys, split_fractions, seed=4).tolist(), splits.tolist())
+
+    def test_stratified_splits(self):
+        store = AnnotationStore(['common', 'rare'])
+        image_indices = []
+        for idx in range(100):
+            image_idx = store.add_image(f'{idx}.jpg', f'images/{idx}.jpg')
+            # Every 10th image also has a rare bbox
+            store.add_boxes(image_idx, [0, 1] if idx % 10 == 0 else [0], 0, [(0, 0, 1, 1)] * (2 if idx % 10 == 0 else 1))
+            image_indices.append(image_idx)
+        strata = splitter.rarest_category_per_image(store, image_indices)
+        self.assertEqual(np.flatnonzero(strata).tolist(), list(range(0, 100, 10)))
+        splits = splitter.assign_stratified_splits(store.image_filenames, strata, splitter.normalize_split_fractions([80, 20]))
+        self.assertEqual(np.bincount(splits[strata == 1]).tolist(), [8, 2])
+        self.assertEqual(np.bincount(splits[strata == 0]).tolist(), [72, 18])
+
+
+if __name__ == "__main__":
+    unittest.main()